@@ -0,0 +1,189 @@
+import os
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from datasets.array_cache import ArrayCache
+from datasets.resampling import resample_befine
+
+
+# bump when the features change, invalidates the cached ones
+KINEMATICS_VERSION = 1
+FEATURE_NAMES = ("bone_lengths", "velocity", "acceleration", "speed", "angles")
+
+
+def angle_triplets(links: Sequence[Sequence[int]]) -> np.ndarray:
+    """Joint angles of a skeleton, as (a, joint, b) triplets of the joints linked to a common joint
+
+    Returns:
+        np.ndarray: [A,3], the angle at joint between the bones joint-a and joint-b
+    """
+    neighbors: Dict[int, list] = {}
+    for a, b in links:
+        neighbors.setdefault(a, []).append(b)
+        neighbors.setdefault(b, []).append(a)
+
+    triplets = [
+        (n[i], j, n[k])
+        for j, n in sorted(neighbors.items())
+        for i in range(len(n))
+        for k in range(i + 1, len(n))
+    ]
+    return np.asarray(triplets, dtype=np.int64).reshape(-1, 3)
+
+
+def bone_lengths(keypoints: np.ndarray, links: Sequence[Sequence[int]]) -> np.ndarray:
+    """Length of every link, keypoints [...,J,3] -> [...,L]"""
+    links = np.asarray(links, dtype=np.int64)
+    bones = keypoints[..., links[:, 1], :] - keypoints[..., links[:, 0], :]
+    return np.linalg.norm(bones, axis=-1)
+
+
+def _spacing(fps: Optional[float], times: Optional[np.ndarray]):
+    if times is not None:
+        times = np.asarray(times, dtype=np.float64)
+        assert np.all(np.diff(times) > 0), "Expected strictly increasing frame times"
+        return times
+    assert fps is not None, "Expected fps or the frame times"
+    return 1 / fps
+
+
+def joint_velocities(
+    keypoints: np.ndarray, fps: Optional[float] = None, times: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Velocity of every joint (central differences), keypoints [...,T,J,3] -> [...,T,J,3]
+
+    Frames are 1/fps seconds apart, or at times [T] (seconds) for irregular sampling.
+    """
+    if keypoints.shape[-3] < 2:
+        return np.zeros_like(keypoints)
+    return np.gradient(keypoints, _spacing(fps, times), axis=-3)
+
+
+def joint_angles(keypoints: np.ndarray, triplets: np.ndarray) -> np.ndarray:
+    """Angles (radians) of the angle_triplets, keypoints [...,J,3] -> [...,A]"""
+    u = keypoints[..., triplets[:, 0], :] - keypoints[..., triplets[:, 1], :]
+    v = keypoints[..., triplets[:, 2], :] - keypoints[..., triplets[:, 1], :]
+    cos = np.einsum("...i,...i->...", u, v) / (
+        np.linalg.norm(u, axis=-1) * np.linalg.norm(v, axis=-1)
+    )
+    return np.arccos(np.clip(cos, -1.0, 1.0))
+
+
+def kinematic_features(
+    keypoints: np.ndarray,
+    links: Sequence[Sequence[int]],
+    fps: Optional[float] = None,
+    times: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """All the kinematic features of a sequence [T,J,3], or of a batch of windows [B,T,J,3]
+
+    Frames are 1/fps seconds apart, or at times [T] (seconds) for irregular sampling.
+
+    Returns:
+        Dict[str, np.ndarray]: float32 arrays
+            bone_lengths    [...,T,L]
+            velocity        [...,T,J,3]
+            acceleration    [...,T,J,3]
+            speed           [...,T,J], norm of the velocity
+            angles          [...,T,A], radians, see angle_triplets(links)
+    """
+    kpts = np.asarray(keypoints, dtype=np.float64)
+    velocity = joint_velocities(kpts, fps, times)
+    res = {
+        "bone_lengths": bone_lengths(kpts, links),
+        "velocity": velocity,
+        "acceleration": joint_velocities(velocity, fps, times),
+        "speed": np.linalg.norm(velocity, axis=-1),
+        "angles": joint_angles(kpts, angle_triplets(links)),
+    }
+    return {k: v.astype(np.float32) for k, v in res.items()}
+
+
+def _chico_kinematics_arrays(
+    person: np.ndarray, robot: np.ndarray, fps: float
+) -> Tuple[np.ndarray, ...]:
+    from datasets.chico_dataset import CHICODataset
+
+    person_features = kinematic_features(person, CHICODataset.keypoints_links, fps)
+    robot_features = kinematic_features(robot, CHICODataset.kuka_links, fps)
+    return tuple(person_features[k] for k in FEATURE_NAMES) + tuple(
+        robot_features[k] for k in FEATURE_NAMES
+    )
+
+
+def chico_kinematics(
+    dataset, index: int, cache: Optional[ArrayCache] = None, fps: float = 25
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """Kinematic features of a CHICODataset recording, for the person and the robot
+
+    With a cache (e.g. ArrayCache("data/chico/features")) the features are
+    computed once per pose file and reloaded memory-mapped afterwards.
+
+    Returns:
+        Dict[str, Dict[str, np.ndarray]]: {"person": features, "robot": features}, see kinematic_features
+    """
+    _, _, person, robot = dataset.get_poses(index)
+
+    def compute(_path: str) -> Tuple[np.ndarray, ...]:
+        return _chico_kinematics_arrays(np.asarray(person), np.asarray(robot), fps)
+
+    if cache is None:
+        arrays = compute("")
+    else:
+        # one namespace per rate: different rates are cached side by side
+        arrays = cache.load_or_parse(
+            dataset.poses_pkls[index], compute, KINEMATICS_VERSION, f"kinematics:{fps}"
+        )
+
+    n = len(FEATURE_NAMES)
+    return {
+        "person": dict(zip(FEATURE_NAMES, arrays[:n])),
+        "robot": dict(zip(FEATURE_NAMES, arrays[n:])),
+    }
+
+
+def befine_kinematics(
+    seq, fps: float = 8, max_gap: Optional[float] = 0.5
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]:
+    """Kinematic features of every body of a BeFineSequence
+
+    The irregular frames are first resampled at fps (datasets/resampling.py),
+    so the derivatives use the real time between the samples. Features next to
+    masked joints are NaN.
+
+    Returns:
+        Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]: body ids [B], features with a leading body axis (e.g. velocity [B,T,18,3]), joint mask [B,T,18]
+    """
+    from datasets.befine.befine_structures import BEFINE_LINKS
+
+    ids, res = resample_befine(seq, fps, max_gap)
+    # [T,B,J,3] -> [B,T,J,3], a batch of sequences
+    tracks = np.moveaxis(res.values, 1, 0)
+    return ids, kinematic_features(tracks, BEFINE_LINKS, fps), np.moveaxis(res.mask, 1, 0)
+
+
+def __test__():
+    import tempfile
+    from benchmarks.synthetic import make_chico
+    from datasets.chico_dataset import CHICODataset
+
+    with tempfile.TemporaryDirectory() as root:
+        make_chico(root, n_subjects=2, actions=["hammer"], n_frames=100)
+        chico = CHICODataset(root, cache_dir=f"{root}/cache")
+        cache = ArrayCache(f"{root}/cache")
+
+        # poses and features at alternating rates share the cache without evicting each other
+        for fps in (25, 10, 25, 10):
+            chico_kinematics(chico, 0, cache, fps)
+        entries = len(os.listdir(f"{root}/cache"))
+        assert entries == 2 + 2, f"Expected 2 pose and 2 feature entries, found {entries}"
+
+        # cache hits are memory-mapped, recomputed features are not
+        for fps in (25, 10, 25, 10):
+            features = chico_kinematics(chico, 0, cache, fps)
+            for name, arr in features["person"].items():
+                assert isinstance(arr, np.memmap), f"{name} at {fps} fps was recomputed"
+    print("ok")
+
+
+if __name__ == "__main__":
+    __test__()
@@ -0,0 +1,253 @@
+import time
+import argparse
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+
+# squared lengths below this are treated as points
+EPS = 1e-12
+
+
+def link_segments(
+    keypoints: np.ndarray, links: Sequence[Sequence[int]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Endpoints of the links of a skeleton
+
+    Args:
+        keypoints (np.ndarray): [...,J,3]
+        links (Sequence[Sequence[int]]): [L,2] joint indices
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: first and second endpoints, [...,L,3] each
+    """
+    links = np.asarray(links, dtype=np.int64)
+    return keypoints[..., links[:, 0], :], keypoints[..., links[:, 1], :]
+
+
+def _clip01(x: np.ndarray) -> np.ndarray:
+    return np.clip(x, 0.0, 1.0)
+
+
+def _safe_div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return num / np.where(den > EPS, den, 1.0)
+
+
+def closest_points_params(
+    p0: np.ndarray, p1: np.ndarray, q0: np.ndarray, q1: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Parameters (s, t) of the closest points of segments p0p1 and q0q1
+
+    Closest points are p0 + s * (p1 - p0) and q0 + t * (q1 - q0), s and t in
+    [0,1]. Inputs [...,3] are broadcast together, degenerate segments (points)
+    are supported. Vectorized version of the algorithm in Ericson, Real-Time
+    Collision Detection, 5.1.9.
+    """
+    d1 = p1 - p0
+    d2 = q1 - q0
+    r = p0 - q0
+    a = np.einsum("...i,...i->...", d1, d1)
+    e = np.einsum("...i,...i->...", d2, d2)
+    f = np.einsum("...i,...i->...", d2, r)
+    c = np.einsum("...i,...i->...", d1, r)
+    b = np.einsum("...i,...i->...", d1, d2)
+
+    # non parallel segments: closest points of the infinite lines, s clamped
+    denom = a * e - b * b
+    s = np.where(denom > EPS, _clip01(_safe_div(b * f - c * e, denom)), 0.0)
+    t = _safe_div(b * s + f, e)
+
+    # t outside the segment: clamp it and recompute s
+    s = np.where(t < 0.0, _clip01(_safe_div(-c, a)), s)
+    s = np.where(t > 1.0, _clip01(_safe_div(b - c, a)), s)
+    t = _clip01(t)
+
+    # degenerate segments
+    s = np.where(a <= EPS, 0.0, s)
+    t = np.where(a <= EPS, _clip01(_safe_div(f, e)), t)
+    t = np.where(e <= EPS, 0.0, t)
+    s = np.where((e <= EPS) & (a > EPS), _clip01(_safe_div(-c, a)), s)
+    return s, t
+
+
+def segment_distances(
+    p0: np.ndarray, p1: np.ndarray, q0: np.ndarray, q1: np.ndarray
+) -> np.ndarray:
+    """Minimum distance between segments p0p1 and q0q1, inputs [...,3] broadcast together"""
+    s, t = closest_points_params(p0, p1, q0, q1)
+    diff = (p0 + s[..., None] * (p1 - p0)) - (q0 + t[..., None] * (q1 - q0))
+    return np.sqrt(np.einsum("...i,...i->...", diff, diff))
+
+
+class MinDistances:
+    """Human-robot minimum distance of every frame
+
+    distance        [T], NaN when no link pair is valid
+    human_link      [T], index in the human links of the closest pair, -1 when invalid
+    robot_link      [T], index in the robot links of the closest pair, -1 when invalid
+    human_point     [T,3], closest point on the human link
+    robot_point     [T,3], closest point on the robot link
+    """
+
+    def __init__(
+        self,
+        distance: np.ndarray,
+        human_link: np.ndarray,
+        robot_link: np.ndarray,
+        human_point: np.ndarray,
+        robot_point: np.ndarray,
+    ) -> None:
+        self.distance = distance
+        self.human_link = human_link
+        self.robot_link = robot_link
+        self.human_point = human_point
+        self.robot_point = robot_point
+
+    def __len__(self) -> int:
+        return len(self.distance)
+
+    def events(self, threshold: float) -> List[Tuple[int, int]]:
+        return threshold_events(self.distance, threshold)
+
+
+def min_distances(
+    person: np.ndarray,
+    robot: np.ndarray,
+    person_links: Sequence[Sequence[int]],
+    robot_links: Sequence[Sequence[int]],
+    chunk_size: int = 4096,
+) -> MinDistances:
+    """Minimum distance between every human link and every robot link, for all the frames
+
+    All the [T,H,R] link pairs are evaluated with numpy broadcasting, chunk_size
+    frames at a time to bound the memory. NaN joints exclude their links.
+
+    Args:
+        person (np.ndarray): human keypoints [T,J,3] (or [J,3] for a single frame)
+        robot (np.ndarray): robot keypoints [T,K,3] (or [K,3])
+        person_links (Sequence[Sequence[int]]): human links [H,2], e.g. CHICODataset.keypoints_links
+        robot_links (Sequence[Sequence[int]]): robot links [R,2], e.g. CHICODataset.kuka_links
+        chunk_size (int, optional): frames evaluated at once. Defaults to 4096.
+    """
+    person = np.asarray(person, dtype=np.float64)
+    robot = np.asarray(robot, dtype=np.float64)
+    if person.ndim == 2:
+        person, robot = person[None], robot[None]
+    assert len(person) == len(robot), "Expected the same number of human and robot frames"
+
+    n_frames = len(person)
+    n_robot = len(robot_links)
+    distance = np.full(n_frames, np.nan)
+    human_link = np.full(n_frames, -1, dtype=np.int64)
+    robot_link = np.full(n_frames, -1, dtype=np.int64)
+    human_point = np.full((n_frames, 3), np.nan)
+    robot_point = np.full((n_frames, 3), np.nan)
+
+    for start in range(0, n_frames, chunk_size):
+        end = min(start + chunk_size, n_frames)
+        # [C,H,1,3] against [C,1,R,3]
+        p0, p1 = link_segments(person[start:end], person_links)
+        q0, q1 = link_segments(robot[start:end], robot_links)
+        p0, p1 = p0[:, :, None], p1[:, :, None]
+        q0, q1 = q0[:, None], q1[:, None]
+
+        s, t = closest_points_params(p0, p1, q0, q1)
+        hp = p0 + s[..., None] * (p1 - p0)
+        rp = q0 + t[..., None] * (q1 - q0)
+        diff = hp - rp
+        d = np.sqrt(np.einsum("...i,...i->...", diff, diff))  # [C,H,R]
+
+        flat = d.reshape(len(d), -1)
+        valid = ~np.isnan(flat).all(axis=1)
+        best = np.argmin(np.where(np.isnan(flat), np.inf, flat), axis=1)
+        rows = np.arange(len(d))
+        h, r = np.divmod(best, n_robot)
+
+        idx = np.arange(start, end)[valid]
+        distance[idx] = flat[rows, best][valid]
+        human_link[idx] = h[valid]
+        robot_link[idx] = r[valid]
+        human_point[idx] = hp[rows, h, r][valid]
+        robot_point[idx] = rp[rows, h, r][valid]
+
+    return MinDistances(distance, human_link, robot_link, human_point, robot_point)
+
+
+def threshold_events(distance: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """Frame intervals [start, end) where the distance is below threshold"""
+    below = np.concatenate([[False], np.asarray(distance) < threshold, [False]])
+    edges = np.flatnonzero(np.diff(below.astype(np.int8)))
+    return [(int(a), int(b)) for a, b in zip(edges[::2], edges[1::2])]
+
+
+class SafetyMonitor:
+    """Minimum distance of live frames with threshold crossing events
+
+    update() returns the distances of a frame and "enter" when the distance
+    falls below threshold, "exit" when it rises above threshold + hysteresis,
+    None otherwise.
+    """
+
+    def __init__(
+        self,
+        person_links: Sequence[Sequence[int]],
+        robot_links: Sequence[Sequence[int]],
+        threshold: float,
+        hysteresis: float = 0.0,
+    ) -> None:
+        self.person_links = person_links
+        self.robot_links = robot_links
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.inside = False
+
+    def update(
+        self, person: np.ndarray, robot: np.ndarray
+    ) -> Tuple[MinDistances, Optional[str]]:
+        res = min_distances(person, robot, self.person_links, self.robot_links)
+        d = res.distance[0]
+        event = None
+        if not self.inside and d < self.threshold:
+            self.inside = True
+            event = "enter"
+        elif self.inside and d > self.threshold + self.hysteresis:
+            self.inside = False
+            event = "exit"
+        return res, event
+
+
+def main():
+    from datasets.chico_dataset import CHICODataset
+
+    parser = argparse.ArgumentParser(
+        description="Human-robot minimum distance of the CHICO recordings"
+    )
+    parser.add_argument("root", nargs="?", default="data/chico")
+    parser.add_argument("--threshold", type=float, default=100.0, help="same unit of the poses (mm)")
+    parser.add_argument("--subjects", nargs="*", default=None)
+    parser.add_argument("--actions", nargs="*", default=None)
+    args = parser.parse_args()
+
+    chico = CHICODataset(args.root, columnar=True)
+    for i in range(len(chico)):
+        subj, act, person, robot = chico.get_poses(i)
+        if args.subjects and subj not in args.subjects:
+            continue
+        if args.actions and act not in args.actions:
+            continue
+
+        start = time.time()
+        res = min_distances(person, robot, chico.keypoints_links, chico.kuka_links)
+        elapsed = time.time() - start
+
+        events = res.events(args.threshold)
+        closest = int(np.nanargmin(res.distance)) if np.isfinite(res.distance).any() else -1
+        print(
+            f"{subj} {act}: {len(res)} frames in {elapsed * 1000:.1f}ms, "
+            f"min {res.distance[closest]:.1f} at frame {closest} "
+            f"(human link {res.human_link[closest]}, robot link {res.robot_link[closest]}), "
+            f"{len(events)} events below {args.threshold}"
+        )
+
+
+if __name__ == "__main__":
+    main()
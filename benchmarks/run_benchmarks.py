@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import traceback
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from benchmarks.synthetic import make_befine, make_chico
+
+
+def timed(fn: Callable[[], object], memory: bool = False) -> Dict[str, float]:
+    """Wall time of fn(), and with memory=True the peak of the Python allocations (numpy included)"""
+    res = {}
+    start = time.perf_counter()
+    fn()
+    res["seconds"] = time.perf_counter() - start
+
+    if memory:
+        # a second run: tracemalloc slows down the allocations
+        tracemalloc.start()
+        fn()
+        res["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+    return res
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    v = np.asarray(values) * scale
+    if len(v) == 0:
+        return {}
+    return {
+        "p50": float(np.percentile(v, 50)),
+        "p90": float(np.percentile(v, 90)),
+        "p99": float(np.percentile(v, 99)),
+        "max": float(v.max()),
+    }
+
+
+def bench_chico_construction(root: str, workers: int) -> Dict:
+    from datasets.chico_dataset import CHICODataset
+
+    res = {}
+    res["pickle"] = timed(lambda: CHICODataset(root), memory=True)
+    res["lazy"] = timed(lambda: CHICODataset(root, lazy=True), memory=True)
+
+    shutil.rmtree(os.path.join(root, "poses_columnar"), ignore_errors=True)
+    res["columnar_build"] = timed(lambda: CHICODataset(root, columnar=True))
+    res["columnar_open"] = timed(lambda: CHICODataset(root, columnar=True), memory=True)
+
+    if workers > 0:
+        res["workers"] = timed(lambda: CHICODataset(root, num_workers=workers))
+        res["workers"]["num_workers"] = workers
+
+    cache_dir = os.path.join(root, "cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    res["cache_cold"] = timed(lambda: CHICODataset(root, cache_dir=cache_dir))
+    res["cache_warm"] = timed(lambda: CHICODataset(root, cache_dir=cache_dir), memory=True)
+    return res
+
+
+def bench_chico_getitem(root: str, workers: int, batch_size: int = 64) -> Dict:
+    from torch.utils.data.dataloader import DataLoader
+    from datasets.chico_dataset import CHICODataset, CHICOWindowDataset
+    from datasets.collate import WindowCollate
+
+    res = {}
+    chico = CHICODataset(root, columnar=True)
+    start = time.perf_counter()
+    for i in range(len(chico)):
+        chico[i]
+    res["sequence_items_per_s"] = len(chico) / (time.perf_counter() - start)
+
+    windows = CHICOWindowDataset(root, columnar=True)
+    res["windows"] = len(windows)
+    indices = random.Random(0).sample(range(len(windows)), min(len(windows), 20000))
+    start = time.perf_counter()
+    for i in indices:
+        windows[i]
+    res["window_items_per_s"] = len(indices) / (time.perf_counter() - start)
+
+    for n in sorted({0, workers}):
+        loader = DataLoader(
+            windows, batch_size=batch_size, shuffle=True, num_workers=n, collate_fn=WindowCollate()
+        )
+        start = time.perf_counter()
+        samples = 0
+        for batch in loader:
+            samples += len(batch[0])
+        elapsed = time.perf_counter() - start
+        res[f"dataloader_workers_{n}"] = {
+            "samples_per_s": samples / elapsed,
+            "batches_per_s": len(loader) / elapsed,
+        }
+    return res
+
+
+def bench_befine_parse(root: str) -> Dict:
+    from datasets.befine.befine_dataset import BeFineDataset, BeFineIterableDataset
+    from datasets.befine.befine_structures import BeFineData, BeFineSequence
+
+    files = BeFineIterableDataset(root).action_files
+    size_mb = sum(os.path.getsize(f) for f in files) / 1024**2
+
+    res = {"files": len(files), "size_mb": size_mb}
+    start = time.perf_counter()
+    frames = sum(len(BeFineSequence.load(f)) for f in files)
+    elapsed = time.perf_counter() - start
+    res["arrays"] = {"frames_per_s": frames / elapsed, "mb_per_s": size_mb / elapsed}
+
+    # the pydantic parser is much slower: a single file
+    start = time.perf_counter()
+    n = len(BeFineData.load(files[0]))
+    res["pydantic_single_file"] = {"frames_per_s": n / (time.perf_counter() - start)}
+
+    res["dataset"] = timed(lambda: BeFineDataset(root), memory=True)
+    res["dataset"]["frames"] = frames
+    return res
+
+
+def bench_render(n_people: int, n_frames: int = 200) -> Dict:
+    from datasets.chico_dataset import CHICODataset
+    from visualizer.open3d_scene import Open3DScene
+    from visualizer.open3d_wrapper import Open3DWrapper
+
+    wrapper = Open3DWrapper(offscreen=True, width=640, height=480)
+    wrapper.initialize_visualizer()
+
+    rng = np.random.default_rng(0)
+    people = rng.normal(size=(n_frames, n_people, 15, 3)) * 300
+    robot = rng.normal(size=(n_frames, 9, 3)) * 200
+    scene = Open3DScene(
+        wrapper, CHICODataset.keypoints_links, robot_links=CHICODataset.kuka_links, radius=20
+    )
+
+    update, render, capture = [], [], []
+    for t in range(n_frames):
+        start = time.perf_counter()
+        scene.update(people[t], robot[t])
+        update.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        wrapper.update()
+        render.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        wrapper.capture()
+        capture.append(time.perf_counter() - start)
+
+    wrapper.destroy_window()
+    total = np.sum(update) + np.sum(render) + np.sum(capture)
+    return {
+        "people": n_people,
+        "scene_update_ms": percentiles(update),
+        "upload_ms": percentiles(render),
+        "capture_ms": percentiles(capture),
+        "fps": n_frames / total,
+    }
+
+
+def bench_bus(redis_url: Optional[str], n_frames: int = 2000, rate: float = 500) -> Dict:
+    import redis
+    from streaming.pose_stream import PosePublisher, PoseSubscriber
+
+    if redis_url is None:
+        # in process stand-in of a local server
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        pub_client = fakeredis.FakeRedis(server=server)
+        sub_client = fakeredis.FakeRedis(server=server)
+        backend = f"fakeredis {fakeredis.__version__}"
+    else:
+        pub_client = redis.Redis.from_url(redis_url)
+        sub_client = redis.Redis.from_url(redis_url)
+        backend = redis_url
+
+    channel = f"__bench__{os.getpid()}"
+    publisher = PosePublisher(channel, pub_client, keep_latest=False)
+    subscriber = PoseSubscriber(channel, sub_client)
+    people = np.random.rand(1, 15, 3).astype(np.float32)
+    robot = np.random.rand(9, 3).astype(np.float32)
+
+    latencies = []
+    done = threading.Event()
+
+    def consume():
+        while not done.is_set():
+            frame = subscriber.latest(timeout=0.5)
+            if frame is not None:
+                latencies.append(time.time() - frame.timestamp)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+
+    publish = []
+    start = time.perf_counter()
+    for i in range(n_frames):
+        t = time.perf_counter()
+        publisher.publish(people, robot)
+        publish.append(time.perf_counter() - t)
+        delay = start + (i + 1) / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    elapsed = time.perf_counter() - start
+
+    time.sleep(0.2)
+    done.set()
+    consumer.join()
+    subscriber.close()
+    return {
+        "backend": backend,
+        "frames": n_frames,
+        "publish_per_s": n_frames / elapsed,
+        "publish_ms": percentiles(publish),
+        "latency_ms": percentiles(latencies),
+        "received": subscriber.received,
+        "skipped": subscriber.skipped,
+    }
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+BENCHMARKS = ["chico_construction", "chico_getitem", "befine_parse", "render", "bus"]
+
+
+def run(args: argparse.Namespace, selected: List[str], data: str, report: Dict) -> None:
+    chico_root = os.path.join(data, "chico")
+    befine_root = os.path.join(data, "befine")
+
+    start = time.perf_counter()
+    if {"chico_construction", "chico_getitem"} & set(selected):
+        # CHICODataset expects at least two subjects folders
+        make_chico(chico_root, max(args.subjects, 2), n_frames=args.frames)
+    if "befine_parse" in selected:
+        make_befine(befine_root, args.subjects, n_frames=args.frames)
+    report["config"]["generation_seconds"] = time.perf_counter() - start
+
+    runs = {
+        "chico_construction": lambda: bench_chico_construction(chico_root, args.workers),
+        "chico_getitem": lambda: bench_chico_getitem(chico_root, args.workers),
+        "befine_parse": lambda: bench_befine_parse(befine_root),
+        "render": lambda: bench_render(args.people),
+        "bus": lambda: bench_bus(args.redis_url),
+    }
+    for name in selected:
+        print(f"Running {name}", file=sys.stderr)
+        try:
+            report["results"][name] = runs[name]()
+        except Exception as e:
+            # e.g. no EGL for offscreen rendering, no redis: the other results are kept
+            traceback.print_exc()
+            report["results"][name] = {"error": f"{type(e).__name__}: {e}"}
+
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark loading, rendering and streaming on synthetic corpora, results as JSON"
+    )
+    parser.add_argument("--only", nargs="*", choices=BENCHMARKS, default=None)
+    parser.add_argument("--subjects", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=1000, help="frames per recording")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--people", type=int, default=4, help="people rendered per frame")
+    parser.add_argument("--redis-url", default=None, help="defaults to an in process fakeredis")
+    parser.add_argument("--data", default=None, help="where the corpora are generated, defaults to a temporary folder")
+    parser.add_argument("--output", default=None, help="JSON file, defaults to stdout")
+    args = parser.parse_args()
+
+    selected = args.only or BENCHMARKS
+    data = args.data or tempfile.mkdtemp(prefix="hrc_bench_")
+
+    report = {
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "data")},
+        "results": {},
+    }
+
+    # the datasets print their progress: stdout is kept for the JSON report
+    with redirect_stdout(sys.stderr):
+        run(args, selected, data, report)
+
+    if args.data is None:
+        shutil.rmtree(data, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    if args.output is None:
+        print(out)
+    else:
+        with open(args.output, "w") as fp:
+            fp.write(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import json
+import pickle
+import argparse
+from typing import List, Optional
+import numpy as np
+from datasets.befine.befine_structures import BEFINE_KEYPOINTS
+
+
+CHICO_SUBJECTS = ["S{0}".format(str(i).zfill(2)) for i in range(12)]
+BEFINE_ACTIONS = ["hammer", "lift", "place_hp", "place_lp", "polish", "span_heavy", "span_light"]
+
+
+def random_motion(
+    rng: np.random.Generator, n_frames: int, n_joints: int, scale: float, center: np.ndarray
+) -> np.ndarray:
+    """Smooth random trajectories [T,J,3]: a random walk of the root plus a jittered rest pose"""
+    pose = rng.normal(size=(n_joints, 3)) * scale
+    root = np.cumsum(rng.normal(size=(n_frames, 1, 3)) * scale * 0.01, axis=0)
+    jitter = rng.normal(size=(n_frames, n_joints, 3)) * scale * 0.005
+    return center + pose + root + jitter
+
+
+def make_chico(
+    root: str,
+    n_subjects: int = 2,
+    actions: Optional[List[str]] = None,
+    n_frames: int = 1000,
+    seed: int = 0,
+) -> str:
+    """Synthetic CHICO corpus, ROOT/poses/Sxx/<action>.pkl in the original pickle layout
+
+    Every pickle is a list of (person keypoints [15][3], robot keypoints [9][3])
+    nested lists, in millimeters.
+    """
+    from datasets.chico_dataset import CHICODataset
+
+    rng = np.random.default_rng(seed)
+    actions = actions or CHICODataset.actions
+    for subject in CHICO_SUBJECTS[:n_subjects]:
+        folder = os.path.join(root, "poses", subject)
+        os.makedirs(folder, exist_ok=True)
+        for action in actions:
+            person = random_motion(rng, n_frames, 15, 300.0, np.array([0.0, 0.0, 1000.0]))
+            robot = random_motion(rng, n_frames, 9, 200.0, np.array([800.0, 0.0, 600.0]))
+            data = [(p.tolist(), r.tolist()) for p, r in zip(person, robot)]
+            with open(os.path.join(folder, f"{action}.pkl"), "wb") as fp:
+                pickle.dump(data, fp)
+    return root
+
+
+def make_befine(
+    root: str,
+    n_subjects: int = 2,
+    actions: Optional[List[str]] = None,
+    n_frames: int = 1000,
+    max_bodies: int = 3,
+    null_prob: float = 0.05,
+    fps: float = 8,
+    seed: int = 0,
+) -> str:
+    """Synthetic BeFine corpus, ROOT/<subject>/actions/<subject>_<action>.csv JSON lines
+
+    Frames have irregular timestamps (milliseconds) and 0..max_bodies bodies;
+    each coordinate is null with probability null_prob.
+    """
+    rng = np.random.default_rng(seed)
+    actions = actions or BEFINE_ACTIONS
+    for s in range(n_subjects):
+        subject = f"subject{s:02d}"
+        folder = os.path.join(root, subject, "actions")
+        os.makedirs(folder, exist_ok=True)
+        for action in actions:
+            motions = [
+                random_motion(rng, n_frames, len(BEFINE_KEYPOINTS), 0.3, np.array([b, 0.0, 2.0]))
+                for b in range(max_bodies)
+            ]
+            steps = rng.normal(1000 / fps, 100 / fps, size=n_frames).clip(1, None)
+            timestamps = (1_600_000_000_000 + np.cumsum(steps)).astype(np.int64)
+            counts = rng.integers(0, max_bodies + 1, size=n_frames)
+
+            with open(os.path.join(folder, f"{subject}_{action}.csv"), "w") as fp:
+                for t in range(n_frames):
+                    bodies = []
+                    for b in range(counts[t]):
+                        kpts = motions[b][t]
+                        nulls = rng.random(kpts.shape) < null_prob
+                        bodies.append(
+                            {
+                                "body_id": f"{subject}-{b}",
+                                "event": [],
+                                "keypoints": {
+                                    name: [
+                                        {
+                                            c: None if nulls[j, i] else float(kpts[j, i])
+                                            for i, c in enumerate("xyz")
+                                        }
+                                    ]
+                                    for j, name in enumerate(BEFINE_KEYPOINTS)
+                                },
+                            }
+                        )
+                    fp.write(json.dumps({"timestamp": int(timestamps[t]), "bodies": bodies}))
+                    fp.write("\n")
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic CHICO / BeFine corpora")
+    parser.add_argument("dataset", choices=["chico", "befine"])
+    parser.add_argument("root")
+    parser.add_argument("--subjects", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.dataset == "chico":
+        make_chico(args.root, args.subjects, n_frames=args.frames, seed=args.seed)
+    else:
+        make_befine(args.root, args.subjects, n_frames=args.frames, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import hashlib
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+from datasets.parallel_loading import parallel_load
+
+
+class ArrayCache:
+    """Persistent cache of parsed recordings, stored as .npy arrays
+
+    Every source file is cached in its own folder named
+        <hash of (path, namespace)>-<hash of (size, mtime, parser version)>
+    so a changed file (or a new parser version) misses the cache and its stale
+    entry is replaced. Namespaces keep different products of the same file
+    apart (e.g. parsed poses and kinematic features at each rate), they never
+    replace each other. Hits are memory-mapped. The least recently used
+    entries are evicted once the cache is larger than max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 8 * 1024**3) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def _hash(s: str) -> str:
+        return hashlib.sha1(s.encode("utf-8")).hexdigest()[:16]
+
+    def entry(self, path: str, parser_version: int, namespace: str = "") -> str:
+        st = os.stat(path)
+        fingerprint = f"{st.st_size}:{st.st_mtime_ns}:{parser_version}"
+        key = os.path.abspath(path)
+        if namespace:
+            key = f"{key}|{namespace}"
+        name = f"{self._hash(key)}-{self._hash(fingerprint)}"
+        return os.path.join(self.cache_dir, name)
+
+    def load(
+        self, path: str, parser_version: int, namespace: str = ""
+    ) -> Optional[Tuple[np.ndarray, ...]]:
+        entry = self.entry(path, parser_version, namespace)
+        if not os.path.isdir(entry):
+            return None
+
+        n = len(os.listdir(entry))
+        arrays = tuple(
+            np.load(os.path.join(entry, f"{i}.npy"), mmap_mode="r") for i in range(n)
+        )
+        # mark as recently used
+        os.utime(entry)
+
+        return arrays
+
+    def save(
+        self,
+        path: str,
+        parser_version: int,
+        arrays: Tuple[np.ndarray, ...],
+        namespace: str = "",
+        evict: bool = True,
+    ) -> None:
+        """Store the arrays of path, evict=False leaves the size cap to a later evict()"""
+        entry = self.entry(path, parser_version, namespace)
+        prefix = os.path.basename(entry).split("-")[0] + "-"
+
+        # drop stale entries of the same file and namespace (not the ones another
+        # process is still writing)
+        for name in os.listdir(self.cache_dir):
+            if ".tmp" in name:
+                continue
+            if name.startswith(prefix) and name != os.path.basename(entry):
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+        tmp = f"{entry}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        for i, a in enumerate(arrays):
+            np.save(os.path.join(tmp, f"{i}.npy"), np.asarray(a), allow_pickle=False)
+
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # written concurrently by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            p = os.path.join(self.cache_dir, name)
+            if ".tmp" in name or not os.path.isdir(p):
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(p))
+            entries.append((os.stat(p).st_mtime, size, p))
+            total += size
+
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(p, ignore_errors=True)
+            total -= size
+
+    def load_or_parse(
+        self,
+        path: str,
+        parser: Callable[[str], Tuple[np.ndarray, ...]],
+        parser_version: int,
+        namespace: str = "",
+    ) -> Tuple[np.ndarray, ...]:
+        arrays = self.load(path, parser_version, namespace)
+        if arrays is None:
+            arrays = parser(path)
+            self.save(path, parser_version, arrays, namespace)
+        return arrays
+
+    def load_many(
+        self,
+        paths: List[str],
+        parser: Callable[[str], Tuple[np.ndarray, ...]],
+        parser_version: int,
+        num_workers: int = 0,
+        namespace: str = "",
+    ) -> List[Tuple[np.ndarray, ...]]:
+        """Load the cached files, the missing ones are parsed (on a process pool if num_workers > 0) and stored"""
+        res: List[Optional[Tuple[np.ndarray, ...]]] = [
+            self.load(p, parser_version, namespace) for p in paths
+        ]
+        misses = [i for i, r in enumerate(res) if r is None]
+
+        if num_workers > 0:
+            parsed = parallel_load(parser, [paths[i] for i in misses], num_workers)
+        else:
+            parsed = (parser(paths[i]) for i in misses)
+
+        # evict() scans the whole cache: once for all the misses
+        for i, arrays in zip(misses, parsed):
+            self.save(paths[i], parser_version, arrays, namespace, evict=False)
+            res[i] = arrays
+
+        if len(misses) > 0:
+            self.evict()
+            print(f"Parsed {len(misses)} files, {len(paths) - len(misses)} cache hits")
+
+        return res
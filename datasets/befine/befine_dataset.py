@@ -1,93 +1,330 @@
-import json
 import os
 import glob
-import pickle
-from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 import torch
 from tqdm import tqdm
-from torch.utils.data.dataset import Dataset
-from torch.utils.data.dataloader import DataLoader
-from datasets.befine.befine_structures import BeFineData
+from torch.utils.data import get_worker_info
+from torch.utils.data.dataset import Dataset, IterableDataset
+from datasets.array_cache import ArrayCache
+from datasets.befine.befine_structures import (
+    BEFINE_PARSER_VERSION,
+    BeFineDatum,
+    BeFineSequence,
+    load_befine_arrays,
+)
+from datasets.parallel_loading import parallel_load
+from datasets.resampling import resample_befine
+
+
+def find_subjects(root: str, subject: Optional[str] = None) -> List[str]:
+    subjects_folders = glob.glob(os.path.join(root, "*"))
+
+    if subject is not None:
+        subjects_folders = [
+            p for p in subjects_folders if p.split(os.sep)[-1] == subject
+        ]
+
+    return subjects_folders
+
+
+def select_action_files(subject_actions: List[str], action: Optional[str] = None) -> List[str]:
+    """Multi-camera action files, optionally only the ones containing `action` in the name"""
+    paths = []
+    for action_path in subject_actions:
+        _, fname = os.path.split(action_path)
+
+        tmp = fname.split(".csv")[0]
+        is_single_camera = "jetsonzed" in "_".join(tmp.split("_")[1:])
+
+        if is_single_camera:
+            continue
+        if action is not None and action not in fname:
+            continue
+        paths.append(action_path)
+
+    return paths
 
 
 class BeFineDataset(Dataset):
     def __init__(
-        self, root: str, subject: Optional[str] = None, action: Optional[str] = None
+        self,
+        root: str,
+        subject: Optional[str] = None,
+        action: Optional[str] = None,
+        num_workers: int = 0,
+        cache_dir: Optional[str] = None,
+        cache_dir_max_bytes: int = 8 * 1024**3,
+        as_arrays: bool = False,
     ) -> None:
+        """BeFine dataset
+
+        Frames of every loaded (subject, action file) recording are reachable
+        through a single flat index: recordings are ordered by subject and file
+        name and a prefix sum of their lengths maps a flat index to a frame.
+
+        Args:
+            root (str): dataset folder, ROOT/<subject>/actions/<action files>
+            subject (Optional[str], optional): load only this subject. Defaults to None.
+            action (Optional[str], optional): load only the action files containing this name. Defaults to None.
+            num_workers (int, optional): if > 0, action files are parsed on a process pool of this size. Defaults to 0.
+            cache_dir (Optional[str], optional): folder where parsed files are cached as arrays, reused while the files are unchanged. Defaults to None.
+            cache_dir_max_bytes (int, optional): size cap of cache_dir, least recently used entries are evicted. Defaults to 8 GiB.
+            as_arrays (bool, optional): items are (timestamp, keypoints [P,18,3]) instead of BeFineDatum, see datasets/collate.py BeFineCollate. Defaults to False.
+        """
         super().__init__()
         self.root = root  # os.path.abspath(root)
         self.action = action
+        self.num_workers = num_workers
+        self.as_arrays = as_arrays
+        self.cache = (
+            ArrayCache(cache_dir, cache_dir_max_bytes) if cache_dir is not None else None
+        )
 
-        subjects_folders = glob.glob(os.path.join(self.root, "*"))
-
-        if subject is not None:
-            subjects_folders = [
-                p for p in subjects_folders if p.split(os.sep)[-1] == subject
-            ]
+        subjects_folders = sorted(find_subjects(self.root, subject))
 
         self.subjects = {
             f: {"actions": self.get_actions(glob.glob(os.path.join(f, "actions", "*")))}
             for f in subjects_folders
         }
 
+        # (subject folder, action path) of every recording, in flat index order
+        self.recordings: List[Tuple[str, str]] = [
+            (f, action_path)
+            for f in subjects_folders
+            for action_path in self.subjects[f]["actions"]
+        ]
+        lengths = [len(self.subjects[f]["actions"][p]) for f, p in self.recordings]
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lengths)
+
     def get_actions(self, subject_actions: str):
-        if len(subject_actions) == 0:
+        # filtering happens on the file names, before any parsing
+        paths = select_action_files(sorted(subject_actions), self.action)
+
+        if len(paths) == 0:
             return {}
 
-        res: Dict[str, List[str]] = {}
-        # root, _ = os.path.split(subject_actions[0])
-        # actions = [s.split(os.sep)[-1] for s in subject_actions]
+        if self.cache is not None:
+            loaded = self.cache.load_many(
+                paths, load_befine_arrays, BEFINE_PARSER_VERSION, self.num_workers
+            )
+            return {
+                p: BeFineSequence.from_arrays(arrays) for p, arrays in zip(paths, loaded)
+            }
 
-        for action_path in tqdm(subject_actions):
-            _, action = os.path.split(action_path)
+        if self.num_workers > 0:
+            return self.get_actions_parallel(paths)
 
-            tmp = action.split(".csv")[0]
-            tmp = tmp.split("_")
-            usr = tmp[0]
-            is_single_camera = "jetsonzed" in "_".join(tmp[1:])
+        res: Dict[str, BeFineSequence] = {}
+        for action_path in tqdm(paths):
+            res[action_path] = BeFineSequence.load(action_path)
 
-            if is_single_camera:
-                # raise NotImplementedError
-                # data = []
-                continue
-            else:
-                data = BeFineData.load(action_path)
+        return res
+
+    def get_actions_parallel(self, paths: List[str]):
+        res: Dict[str, BeFineSequence] = {}
+        loaded = parallel_load(load_befine_arrays, paths, self.num_workers)
+        for action_path, arrays in zip(paths, loaded):
+            res[action_path] = BeFineSequence.from_arrays(arrays)
+
+        return res
+
+    @property
+    def num_frames(self) -> int:
+        """Frames of all the recordings, the range of the flat frame index"""
+        return int(self.offsets[-1])
+
+    def locate(self, index: int) -> Tuple[str, str, int]:
+        """Map a flat frame index to (subject folder, action path, frame index) in O(log n)"""
+        n = self.num_frames
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError(f"Index {index} out of range for {n} frames")
+
+        r = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        subj, action_path = self.recordings[r]
+
+        return subj, action_path, index - int(self.offsets[r])
+
+    def body_counts(self) -> np.ndarray:
+        """Number of bodies of every frame, in flat index order"""
+        counts = [
+            np.diff(self.subjects[f]["actions"][p].body_offsets)
+            for f, p in self.recordings
+        ]
+        return np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def __getitem__(self, index) -> Union[BeFineDatum, Tuple[int, np.ndarray]]:
+        subj, action_path, frame = self.locate(index)
+        act: BeFineSequence = self.subjects[subj]["actions"][action_path]
+
+        if self.as_arrays:
+            return int(act.timestamps[frame]), act.bodies(frame)
+
+        return act[frame]
 
-            if self.action is not None:
-                if self.action not in action:
+
+class BeFineIterableDataset(IterableDataset):
+    """Streaming BeFine dataset
+
+    Action files are parsed incrementally (chunk_size frames at a time) while
+    iterating, so the first frames are available before a file is fully read
+    and memory does not grow with the recording length.
+
+    Yields BeFineDatum frames, or BeFineSequence chunks if chunks=True. With
+    multiple DataLoader workers the files are split among workers.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        subject: Optional[str] = None,
+        action: Optional[str] = None,
+        chunk_size: int = 256,
+        chunks: bool = False,
+    ) -> None:
+        super().__init__()
+        self.root = root
+        self.action = action
+        self.chunk_size = chunk_size
+        self.chunks = chunks
+
+        self.action_files = [
+            p
+            for f in sorted(find_subjects(self.root, subject))
+            for p in select_action_files(
+                sorted(glob.glob(os.path.join(f, "actions", "*"))), action
+            )
+        ]
+
+    def __iter__(self) -> Iterator[Union[BeFineDatum, BeFineSequence]]:
+        files = self.action_files
+        worker = get_worker_info()
+        if worker is not None:
+            files = files[worker.id :: worker.num_workers]
+
+        for action_path in files:
+            for chunk in BeFineSequence.iter_chunks(action_path, self.chunk_size):
+                if self.chunks:
+                    yield chunk
                     continue
+                for i in range(len(chunk)):
+                    yield chunk[i]
 
-            res[action_path] = data
 
-        return res
+class BeFineWindowDataset(BeFineDataset):
+    """BeFine forecasting windows on a uniform time grid
+
+    Every body of every recording is resampled once at fps from the frame
+    timestamps (datasets/resampling.py), then copied into two preallocated
+    tensors (keypoints [N,18,3], mask [N,18]) with a flat (track, start) index
+    of every window, as CHICOWindowDataset does. Windows are kept when the
+    body is visible (at least one valid joint) in at least min_coverage of
+    their frames.
+
+    len() and the indices of __getitem__ are windows; the inherited locate(),
+    body_counts() and num_frames still address the frames of the recordings.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        fps: float = 8,
+        input_len: int = 10,
+        output_len: int = 25,
+        stride: int = 1,
+        max_gap: Optional[float] = 0.5,
+        min_coverage: float = 1.0,
+        subject: Optional[str] = None,
+        action: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Args:
+            root (str): dataset folder, ROOT/<subject>/actions/<action files>
+            fps (float, optional): rate of the windows. Defaults to 8.
+            input_len (int, optional): input frames. Defaults to 10.
+            output_len (int, optional): target frames. Defaults to 25.
+            stride (int, optional): frames between consecutive windows of a track. Defaults to 1.
+            max_gap (Optional[float], optional): longest interval (seconds) without a joint that is interpolated, longer ones are masked. Defaults to 0.5.
+            min_coverage (float, optional): fraction of the window frames where the body must be visible. Defaults to 1.0.
+            subject, action and kwargs are passed to BeFineDataset.
+        """
+        super().__init__(root, subject, action, **kwargs)
+
+        assert input_len > 0 and output_len >= 0, "Expected positive window lengths"
+        assert stride > 0, "Expected a positive stride"
+        assert 0.0 <= min_coverage <= 1.0, "Expected min_coverage in [0,1]"
+
+        self.fps = fps
+        self.input_len = input_len
+        self.output_len = output_len
+        self.span = input_len + output_len
+
+        keypoints, masks, windows = [], [], []
+        # subject folder, action path, body id of every track
+        self.tracks: List[Tuple[str, str, str]] = []
+        start = 0
+        for subj, action_path in self.recordings:
+            seq: BeFineSequence = self.subjects[subj]["actions"][action_path]
+            if len(seq) == 0:
+                continue
+            ids, res = resample_befine(seq, fps, max_gap)
+
+            for b, body_id in enumerate(ids):
+                mask = res.mask[:, b]
+                visible = np.zeros(len(mask) + 1, dtype=np.int64)
+                visible[1:] = np.cumsum(mask.any(axis=1))
+
+                # visible frames of every window, from the prefix sum
+                starts = np.arange(0, len(mask) - self.span + 1, stride, dtype=np.int64)
+                coverage = visible[starts + self.span] - visible[starts]
+                starts = starts[coverage >= min_coverage * self.span]
+
+                track = len(self.tracks)
+                self.tracks.append((subj, action_path, str(body_id)))
+                windows.append(np.stack([np.full_like(starts, track), start + starts], axis=1))
+                keypoints.append(res.values[:, b])
+                masks.append(mask)
+                start += len(mask)
+
+        self.keypoints = torch.from_numpy(
+            np.concatenate(keypoints).astype(np.float32)
+            if keypoints
+            else np.zeros((0, 18, 3), dtype=np.float32)
+        )
+        self.mask = torch.from_numpy(
+            np.concatenate(masks) if masks else np.zeros((0, 18), dtype=bool)
+        )
+        # track index, first frame (global) of every window
+        self.windows = (
+            np.concatenate(windows) if windows else np.zeros((0, 2), dtype=np.int64)
+        )
+
+        print(f"Found {len(self.windows)} windows in {len(self.tracks)} tracks")
 
     def __len__(self) -> int:
-        if len(self.subjects) == 0:
-            return 0
-        subj = next(iter(self.subjects))
-        actions = self.subjects[subj]
-        if len(actions) == 0:
-            return 0
-
-        all_actions: Dict[str, BeFineData] = actions["actions"]
-        act_name = next(iter(all_actions))
-        act: BeFineData = all_actions[act_name]
-
-        return len(act.data)
-
-    def __getitem__(self, index):
-        if len(self.subjects) == 0:
-            return None
-        subj = next(iter(self.subjects))
-        actions = self.subjects[subj]
-        if len(actions) == 0:
-            return None
-
-        all_actions: Dict[str, BeFineData] = actions["actions"]
-        act_name = next(iter(all_actions))
-        act: BeFineData = all_actions[act_name]
-
-        return act.data[index]
+        return len(self.windows)
+
+    def __getitem__(self, index) -> Tuple[torch.Tensor, ...]:
+        """Get a forecasting window
+
+        Returns:
+            Tuple[torch.Tensor, ...]: input [input_len,18,3], target [output_len,18,3], input mask [input_len,18], target mask [output_len,18]. Keypoints are NaN where the mask is False. These are views of the preallocated tensors.
+        """
+        _, start = (int(v) for v in self.windows[index])
+        frames = slice(start, start + self.span)
+
+        kpts = self.keypoints[frames]
+        mask = self.mask[frames]
+
+        n = self.input_len
+        return kpts[:n], kpts[n:], mask[:n], mask[n:]
 
 
 def __test__():
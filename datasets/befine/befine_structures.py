@@ -1,7 +1,16 @@
 import json
 import numpy as np
-from typing import Any, List, Optional
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from pydantic import BaseModel
+from profiling.profiler import timed
+
+try:
+    # optional, about twice as fast as json for the BeFineSequence.load fast path
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 """
 {
@@ -36,6 +45,47 @@ from pydantic import BaseModel
 """
 
 
+# bump when the BeFineSequence arrays change, invalidates datasets/array_cache.py entries
+BEFINE_PARSER_VERSION = 1
+
+BEFINE_KEYPOINTS = [
+    "nose",
+    "left_ear",
+    "right_ear",
+    "left_shoulder",
+    "right_shoulder",
+    "left_elbow",
+    "right_elbow",
+    "left_wrist",
+    "right_wrist",
+    "left_hip",
+    "right_hip",
+    "left_knee",
+    "right_knee",
+    "left_ankle",
+    "right_ankle",
+    "neck",
+    "chest",
+    "mid_hip",
+]
+
+# skeleton links, as indices of BEFINE_KEYPOINTS
+BEFINE_LINKS = [
+    [3, 4],
+    [3, 5],
+    [4, 6],
+    [5, 7],
+    [6, 8],
+    [9, 3],
+    [10, 4],
+    [11, 9],
+    [12, 10],
+    [11, 13],
+    [12, 14],
+    [0, 16],
+]
+
+
 class BeFineBodyKeypointCoords(BaseModel):
     name: str
     x: Optional[float]
@@ -93,10 +143,214 @@ class BeFineData(BaseModel):
 
     data: List[BeFineDatum] = []
 
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index: int) -> BeFineDatum:
+        return self.data[index]
+
     @staticmethod
+    @timed("befine.load_pydantic")
     def load(path: str):
         with open(path, "r") as fp:
             lines = fp.readlines()
 
         data = {"data": [BeFineDatum(**json.loads(s)) for s in lines]}
         return BeFineData(**data)
+
+
+class BeFineSequence:
+    """Array representation of a BeFine action file
+
+    Frames are stored as
+        timestamps      int64 [T]
+        body_offsets    int64 [T+1], bodies of frame i are body_offsets[i]:body_offsets[i+1]
+        body_ids        str [N]
+        body_events     str [N], JSON encoded events of each body
+        keypoints       float32 [N,18,3], ordered as BEFINE_KEYPOINTS, NaN for null coordinates
+
+    BeFineDatum objects are only built on demand by __getitem__.
+
+    BeFineSequence.load parses a file straight into these arrays, skipping the
+    per-keypoint pydantic validation done by BeFineData.load.
+    BeFineSequence.iter_chunks parses the same file incrementally, in chunks of
+    frames, with constant memory.
+    """
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        body_offsets: np.ndarray,
+        body_ids: np.ndarray,
+        body_events: np.ndarray,
+        keypoints: np.ndarray,
+    ) -> None:
+        assert len(body_offsets) == len(timestamps) + 1, "Expected T+1 body offsets"
+        assert len(body_ids) == len(keypoints) == body_offsets[-1], "Bodies mismatch"
+
+        self.timestamps = timestamps
+        self.body_offsets = body_offsets
+        self.body_ids = body_ids
+        self.body_events = body_events
+        self.keypoints = keypoints
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, index: int) -> BeFineDatum:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {index} out of range for {len(self)} frames")
+
+        start, end = self.body_offsets[index], self.body_offsets[index + 1]
+        bodies = [
+            {
+                "body_id": str(self.body_ids[b]),
+                "event": json.loads(str(self.body_events[b])),
+                "keypoints": self._keypoints_dict(self.keypoints[b]),
+            }
+            for b in range(start, end)
+        ]
+        return BeFineDatum(timestamp=int(self.timestamps[index]), bodies=bodies)
+
+    @staticmethod
+    def _keypoints_dict(kpts: np.ndarray) -> Dict[str, List[Dict[str, Optional[float]]]]:
+        f = lambda v: None if np.isnan(v) else float(v)
+        return {
+            name: [{"x": f(k[0]), "y": f(k[1]), "z": f(k[2])}]
+            for name, k in zip(BEFINE_KEYPOINTS, kpts)
+        }
+
+    @staticmethod
+    @timed("befine.load")
+    def load(path: str) -> "BeFineSequence":
+        with open(path, "rb") as fp:
+            return BeFineSequence.parse(fp)
+
+    @staticmethod
+    def iter_chunks(path: str, chunk_size: int = 256) -> Iterator["BeFineSequence"]:
+        """Stream a BeFine action file as consecutive chunks of at most chunk_size frames"""
+        assert chunk_size > 0, "Expected a positive chunk size"
+
+        with open(path, "rb") as fp:
+            while True:
+                chunk = BeFineSequence.parse(islice(fp, chunk_size))
+                if len(chunk) == 0:
+                    return
+                yield chunk
+
+    @staticmethod
+    def parse(lines: Iterable[bytes]) -> "BeFineSequence":
+        timestamps: List[int] = []
+        counts: List[int] = []
+        body_ids: List[str] = []
+        body_events: List[str] = []
+        coords: List[Optional[float]] = []
+
+        null = [{"x": None, "y": None, "z": None}]
+        get_keypoints = itemgetter(*BEFINE_KEYPOINTS)
+        get_xyz = itemgetter("x", "y", "z")
+        for line in lines:
+            if not line.strip():
+                continue
+            datum = json_loads(line)
+            bodies = datum.get("bodies", [])
+            timestamps.append(datum["timestamp"])
+            counts.append(len(bodies))
+            for b in bodies:
+                body_ids.append(b["body_id"])
+                event = b.get("event", [])
+                body_events.append(json.dumps(event) if event else "[]")
+                kpts = b["keypoints"]
+                try:
+                    kpts = get_keypoints(kpts)
+                except KeyError:
+                    kpts = [kpts.get(name, null) for name in BEFINE_KEYPOINTS]
+                for c in kpts:
+                    coords += get_xyz(c[0])
+
+        body_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        body_offsets[1:] = np.cumsum(counts)
+
+        # None -> NaN is done by numpy in a single pass
+        keypoints = np.array(coords, dtype=np.float32)
+
+        return BeFineSequence(
+            np.asarray(timestamps, dtype=np.int64),
+            body_offsets,
+            np.asarray(body_ids, dtype=str),
+            np.asarray(body_events, dtype=str),
+            keypoints.reshape(len(body_ids), len(BEFINE_KEYPOINTS), 3),
+        )
+
+    def to_data(self) -> BeFineData:
+        return BeFineData(data=[self[i] for i in range(len(self))])
+
+    def bodies(self, index: int) -> np.ndarray:
+        """Keypoints of all the bodies in a frame, [P,18,3]"""
+        return self.keypoints[self.body_offsets[index] : self.body_offsets[index + 1]]
+
+    def tracks(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Keypoints of every body as a dense track over all the frames
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: sorted body ids [B], keypoints [T,B,18,3] NaN where the body is absent
+        """
+        ids, body_index = np.unique(self.body_ids, return_inverse=True)
+        frame_index = np.repeat(np.arange(len(self)), np.diff(self.body_offsets))
+
+        res = np.full(
+            (len(self), len(ids), len(BEFINE_KEYPOINTS), 3), np.nan, dtype=np.float32
+        )
+        res[frame_index, body_index] = self.keypoints
+        return ids, res
+
+    def to_arrays(self) -> Tuple[np.ndarray, ...]:
+        return (
+            self.timestamps,
+            self.body_offsets,
+            self.body_ids,
+            self.body_events,
+            self.keypoints,
+        )
+
+    @staticmethod
+    def from_arrays(arrays: Tuple[np.ndarray, ...]) -> "BeFineSequence":
+        return BeFineSequence(*arrays)
+
+    @staticmethod
+    def from_data(data: BeFineData) -> "BeFineSequence":
+        timestamps = np.asarray([d.timestamp for d in data.data], dtype=np.int64)
+        counts = [len(d.bodies) for d in data.data]
+        body_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        body_offsets[1:] = np.cumsum(counts)
+
+        bodies = [b for d in data.data for b in d.bodies]
+        keypoints = np.full((len(bodies), len(BEFINE_KEYPOINTS), 3), np.nan, np.float32)
+        index = {name: i for i, name in enumerate(BEFINE_KEYPOINTS)}
+        for i, b in enumerate(bodies):
+            for k in b.keypoints.coords:
+                keypoints[i, index[k.name]] = [
+                    np.nan if v is None else v for v in (k.x, k.y, k.z)
+                ]
+
+        return BeFineSequence(
+            timestamps,
+            body_offsets,
+            np.asarray([b.body_id for b in bodies], dtype=str),
+            np.asarray([json.dumps(b.event) for b in bodies], dtype=str),
+            keypoints,
+        )
+
+
+def iter_befine_frames(path: str, chunk_size: int = 256) -> Iterator[BeFineDatum]:
+    """Stream the frames of a BeFine action file, only chunk_size frames are parsed at a time"""
+    for chunk in BeFineSequence.iter_chunks(path, chunk_size):
+        for i in range(len(chunk)):
+            yield chunk[i]
+
+
+def load_befine_arrays(path: str) -> Tuple[np.ndarray, ...]:
+    """Parse a BeFine action file into the arrays of BeFineSequence (picklable for process pools)"""
+    return BeFineSequence.load(path).to_arrays()
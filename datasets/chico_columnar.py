@@ -0,0 +1,222 @@
+import os
+import glob
+import json
+import pickle
+import argparse
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from profiling.profiler import timed
+
+
+COLUMNAR_FOLDER = "poses_columnar"
+# bump when the columnar files or index.json change, older conversions are rebuilt
+COLUMNAR_VERSION = 2
+# bump when read_pickle_arrays output changes, invalidates datasets/array_cache.py entries
+CHICO_PARSER_VERSION = 1
+
+PERSON_SHAPE = (15, 3)
+ROBOT_SHAPE = (9, 3)
+
+
+@timed("chico.read_pickle")
+def read_pickle_arrays(pickle_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Read a CHICO pose pickle as contiguous float32 arrays
+
+    Args:
+        pickle_path (str): path of the pickle (ROOT/poses/Sxx/action.pkl)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: person keypoints [T,15,3], robot keypoints [T,9,3]
+    """
+    with open(pickle_path, "rb") as fp:
+        data = pickle.load(fp)
+
+    person_kpts = np.asarray([d[0] for d in data], dtype=np.float32)
+    robot_kpts = np.asarray([d[1] for d in data], dtype=np.float32)
+
+    return (
+        person_kpts.reshape((-1,) + PERSON_SHAPE),
+        robot_kpts.reshape((-1,) + ROBOT_SHAPE),
+    )
+
+
+def subject_and_action(path: str) -> Tuple[str, str]:
+    res, action = os.path.split(path)
+    _, subject = os.path.split(res)
+
+    action = action.replace(".pkl", "")
+
+    return subject, action
+
+
+def source_fingerprints(poses_path: str, poses_pkls: List[str]) -> Dict[str, List[int]]:
+    """[size, mtime (ns)] of every pickle, by path relative to poses_path"""
+    res = {}
+    for p in poses_pkls:
+        st = os.stat(p)
+        res[os.path.relpath(p, poses_path).replace(os.sep, "/")] = [st.st_size, st.st_mtime_ns]
+    return res
+
+
+def _is_up_to_date(index_path: str, sources: Dict[str, List[int]]) -> bool:
+    try:
+        with open(index_path, "r") as fp:
+            index = json.load(fp)
+    except (OSError, ValueError):
+        return False
+    return (
+        index.get("version") == COLUMNAR_VERSION
+        and index.get("parser_version") == CHICO_PARSER_VERSION
+        and index.get("sources") == sources
+    )
+
+
+def build_columnar_poses(root: str, rebuild: bool = False) -> str:
+    """One-time conversion of ROOT/poses/Sxx/*.pkl into the columnar format
+
+    Output folder (ROOT/poses_columnar):
+        person.f32      raw float32 [N,15,3], all recordings concatenated
+        robot.f32       raw float32 [N,9,3], same frame order of person.f32
+        index.json      offset and length (in frames) of every (subject, action),
+                        size and mtime of every source pickle
+
+    An existing conversion is reused while the pickles (added, removed, size,
+    mtime), the format and the parser version are unchanged, otherwise it is
+    rebuilt, as datasets/array_cache.py does.
+
+    Args:
+        root (str): CHICO root folder
+        rebuild (bool, optional): overwrite an existing conversion even if up to date. Defaults to False.
+
+    Returns:
+        str: path of the columnar folder
+    """
+    out_dir = os.path.join(root, COLUMNAR_FOLDER)
+    index_path = os.path.join(out_dir, "index.json")
+
+    poses_path = os.path.join(root, "poses")
+    assert os.path.isdir(poses_path), f"Folder not found {poses_path}!"
+
+    poses_pkls = sorted(glob.glob(poses_path + "/**/*.pkl", recursive=True))
+    sources = source_fingerprints(poses_path, poses_pkls)
+    if not rebuild and _is_up_to_date(index_path, sources):
+        return out_dir
+
+    os.makedirs(out_dir, exist_ok=True)
+    person_tmp = os.path.join(out_dir, "person.f32.tmp")
+    robot_tmp = os.path.join(out_dir, "robot.f32.tmp")
+
+    sequences: List[Dict] = []
+    offset = 0
+    # Stream one recording at a time, only a single pickle is kept in memory
+    with open(person_tmp, "wb") as fp_person, open(robot_tmp, "wb") as fp_robot:
+        for p in poses_pkls:
+            person_kpts, robot_kpts = read_pickle_arrays(p)
+            assert len(person_kpts) == len(
+                robot_kpts
+            ), f"Person and robot frames mismatch in {p}"
+
+            fp_person.write(np.ascontiguousarray(person_kpts).tobytes())
+            fp_robot.write(np.ascontiguousarray(robot_kpts).tobytes())
+
+            subject, action = subject_and_action(p)
+            n = len(person_kpts)
+            sequences.append(
+                {"subject": subject, "action": action, "offset": offset, "length": n}
+            )
+            offset += n
+
+    index = {
+        "version": COLUMNAR_VERSION,
+        "parser_version": CHICO_PARSER_VERSION,
+        "sources": sources,
+        "frames": offset,
+        "person_shape": list(PERSON_SHAPE),
+        "robot_shape": list(ROBOT_SHAPE),
+        "sequences": sequences,
+    }
+
+    os.replace(person_tmp, os.path.join(out_dir, "person.f32"))
+    os.replace(robot_tmp, os.path.join(out_dir, "robot.f32"))
+    # index is written last: its presence marks a complete conversion
+    with open(index_path + ".tmp", "w") as fp:
+        json.dump(index, fp, indent=1)
+    os.replace(index_path + ".tmp", index_path)
+
+    print(f"Converted {len(sequences)} files ({offset} frames) into {out_dir}")
+
+    return out_dir
+
+
+class ColumnarPoses:
+    """Read-only, memory-mapped view of a columnar CHICO conversion
+
+    Opening is O(metadata): the binary files are mapped, never read, so several
+    DataLoader workers share the same page cache.
+    """
+
+    def __init__(self, path: str) -> None:
+        index_path = os.path.join(path, "index.json")
+        assert os.path.isfile(index_path), f"Columnar index not found {index_path}!"
+
+        with open(index_path, "r") as fp:
+            index = json.load(fp)
+
+        if index["version"] != COLUMNAR_VERSION:
+            raise RuntimeError(
+                f"Columnar poses version {index['version']} is not supported (expected {COLUMNAR_VERSION}), rebuild it"
+            )
+
+        self.path = path
+        self.frames: int = index["frames"]
+        self.sequences: List[Dict] = index["sequences"]
+
+        self.person = self._open("person.f32", tuple(index["person_shape"]))
+        self.robot = self._open("robot.f32", tuple(index["robot_shape"]))
+
+    def _open(self, fname: str, shape: Tuple[int, ...]) -> np.ndarray:
+        if self.frames == 0:
+            # np.memmap cannot map empty files
+            return np.empty((0,) + shape, dtype=np.float32)
+
+        return np.memmap(
+            os.path.join(self.path, fname),
+            dtype=np.float32,
+            mode="r",
+            shape=(self.frames,) + shape,
+        )
+
+    def select(
+        self, subject: Optional[str] = None, action: Optional[str] = None
+    ) -> List[Dict]:
+        return [
+            s
+            for s in self.sequences
+            if (subject is None or s["subject"] == subject)
+            and (action is None or s["action"] == action)
+        ]
+
+    def get(self, sequence: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero-copy views of a recording
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: person keypoints [T,15,3], robot keypoints [T,9,3]
+        """
+        start = sequence["offset"]
+        end = start + sequence["length"]
+        return self.person[start:end], self.robot[start:end]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert CHICO pose pickles into the memory-mappable columnar format"
+    )
+    parser.add_argument("root", nargs="?", default="data/chico")
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    build_columnar_poses(args.root, rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,22 @@ import os
 import glob
 import pickle
 from typing import Any, List, Optional, Tuple
+import numpy as np
 import torch
 from torch.utils.data.dataset import Dataset
 from torch.utils.data.dataloader import DataLoader
+from datasets.array_cache import ArrayCache
+from datasets.chico_columnar import (
+    CHICO_PARSER_VERSION,
+    ColumnarPoses,
+    build_columnar_poses,
+    read_pickle_arrays,
+)
+from datasets.chico_rgb import CHICORGB, RGBClip
+from datasets.lru_cache import ByteLRUCache
+from datasets.parallel_loading import parallel_load
+from datasets.resampling import resample_uniform, uniform_times
+from profiling.profiler import timed
 
 
 class CHICODataset(Dataset):
@@ -46,8 +59,31 @@ class CHICODataset(Dataset):
     Keypoints linkings
     [[0,1], [1,2], [2,3], [0,4], [4,5], [5,6], [1,9], [4,12], [8,7], [8,9], [8,12], [9,10], [10,11], [12,13], [13,14]]
 
+    # ----------------------------------------------------------
+    With columnar=True the pickles are converted once into ROOT/poses_columnar
+    (see datasets/chico_columnar.py) and opened with np.memmap: keypoints are
+    returned as read-only float32 arrays instead of nested lists.
+
+    With lazy=True only the file list is indexed at construction: a recording
+    is unpickled on first access (as float32 arrays) and kept in an LRU cache
+    bounded by max_cache_bytes.
+
+    With num_workers > 0 the pickles are parsed on a process pool, recordings
+    are returned as float32 arrays through shared memory.
+
+    With cache_dir set, parsed recordings are stored there as arrays (see
+    datasets/array_cache.py) and reloaded memory-mapped while the pickles are
+    unchanged.
+
+    With rgb=True (requires PyAV) the second element of every item is an
+    RGBClip: frames of all the cameras are decoded on demand with
+    clip.read(pose_frames), see datasets/chico_rgb.py. Otherwise rgb/ is ignored.
+
     """
 
+    # poses are sampled at a fixed rate
+    FPS = 25
+
     actions = [
         "hammer",
         "lift",
@@ -115,9 +151,24 @@ class CHICODataset(Dataset):
         root: str,
         action_filter: Optional[str] = None,
         subject_filter: Optional[str] = None,
+        columnar: bool = False,
+        lazy: bool = False,
+        max_cache_bytes: int = 512 * 1024 * 1024,
+        num_workers: int = 0,
+        cache_dir: Optional[str] = None,
+        cache_dir_max_bytes: int = 8 * 1024**3,
+        rgb: bool = False,
+        rgb_scale: float = 1.0,
+        rgb_cache_bytes: int = 256 * 1024 * 1024,
     ) -> None:
         super().__init__()
 
+        self.lazy = lazy and not columnar
+        self.cache = (
+            ArrayCache(cache_dir, cache_dir_max_bytes) if cache_dir is not None else None
+        )
+        self.poses: List[Tuple[str, str, Any, Any]] = []
+
         assert os.path.isdir(root), f"Folder not found {root}!"
 
         poses_path = os.path.join(root, "poses")
@@ -133,10 +184,11 @@ class CHICODataset(Dataset):
         if not rgb_found:
             print(f"No RGB found in {root}")
 
-        if rgb_found:
-            raise NotImplementedError("TODO: implement RGB loading")
-
-        poses_pkls = glob.glob(poses_path + "/**/*.pkl", recursive=True)
+        self.rgb: Optional[CHICORGB] = None
+        if rgb_found and rgb:
+            self.rgb = CHICORGB(rgb_path, scale=rgb_scale, max_cache_bytes=rgb_cache_bytes)
+        elif rgb_found:
+            print(f"RGB found in {root} but not loaded (rgb=False)")
 
         if action_filter is not None:
             if action_filter not in self.actions:
@@ -144,6 +196,14 @@ class CHICODataset(Dataset):
                 print(err)
                 raise RuntimeError(err)
 
+        if columnar:
+            self.__load_columnar(root, action_filter, subject_filter)
+            print(f"Found {len(self.poses)} files")
+            return
+
+        poses_pkls = glob.glob(poses_path + "/**/*.pkl", recursive=True)
+
+        if action_filter is not None:
             poses_pkls = [
                 p for p in poses_pkls if f"{action_filter}.pkl" in os.path.split(p)[1]
             ]
@@ -153,10 +213,26 @@ class CHICODataset(Dataset):
             ]
 
         self.poses_pkls = poses_pkls
+
+        if self.lazy:
+            self.index = [self.__get_subject_and_action(p) for p in poses_pkls]
+            self.sequences_cache = ByteLRUCache(max_cache_bytes)
+            # frames of every recording, known once it has been read
+            self.lengths: List[Optional[int]] = [None] * len(poses_pkls)
+            print(f"Found {len(self.poses_pkls)} files")
+            return
+
         # self.poses = {
         #     self.__get_subject_and_action(p): read_pickle(p) for p in poses_pkls
         # }
-        tmp = [self.read_pickle(p) for p in poses_pkls]
+        if self.cache is not None:
+            tmp = self.cache.load_many(
+                poses_pkls, read_pickle_arrays, CHICO_PARSER_VERSION, num_workers
+            )
+        elif num_workers > 0:
+            tmp = list(parallel_load(read_pickle_arrays, poses_pkls, num_workers))
+        else:
+            tmp = [self.read_pickle(p) for p in poses_pkls]
 
         # subject, action, person_kpts, robot_kpts
         self.poses = [
@@ -166,6 +242,22 @@ class CHICODataset(Dataset):
 
         print(f"Found {len(self.poses)} files")
 
+    def __load_columnar(
+        self, root: str, action_filter: Optional[str], subject_filter: Optional[str]
+    ) -> None:
+        columnar_path = build_columnar_poses(root)
+        self.columnar = ColumnarPoses(columnar_path)
+
+        sequences = self.columnar.select(subject_filter, action_filter)
+        self.poses_pkls = [
+            os.path.join(root, "poses", s["subject"], s["action"] + ".pkl")
+            for s in sequences
+        ]
+        # subject, action, person_kpts, robot_kpts (memmap views, no copies)
+        self.poses = [
+            (s["subject"], s["action"]) + self.columnar.get(s) for s in sequences
+        ]
+
     def __get_subject_and_action(self, path: str):
         res, action = os.path.split(path)
         _, subject = os.path.split(res)
@@ -174,6 +266,7 @@ class CHICODataset(Dataset):
 
         return subject, action
 
+    @timed("chico.read_pickle")
     def read_pickle(self, pickle_path: str):
         person_kpts = []
         robot_kpts = []
@@ -185,22 +278,178 @@ class CHICODataset(Dataset):
 
         return person_kpts, robot_kpts
 
+    def get_poses(self, index: int) -> Tuple[str, str, Any, Any]:
+        if not self.lazy:
+            return self.poses[index]
+
+        person_kpts, robot_kpts = self.sequences_cache.get_or_load(
+            index, lambda: self.read_arrays(self.poses_pkls[index])
+        )
+        self.lengths[index] = len(person_kpts)
+        return self.index[index] + (person_kpts, robot_kpts)
+
+    def read_arrays(self, pickle_path: str) -> Tuple[Any, Any]:
+        if self.cache is None:
+            return read_pickle_arrays(pickle_path)
+        return self.cache.load_or_parse(
+            pickle_path, read_pickle_arrays, CHICO_PARSER_VERSION
+        )
+
+    def sequence_lengths(self) -> List[int]:
+        """Frames of every recording (e.g. for datasets/collate.py LengthBucketSampler)
+
+        Lazily, the recordings not read yet are parsed once without entering the
+        LRU cache; with cache_dir only the header of their cached arrays is read.
+        """
+        if not self.lazy:
+            return [len(p[2]) for p in self.poses]
+        for i, n in enumerate(self.lengths):
+            if n is None:
+                self.lengths[i] = len(self.read_arrays(self.poses_pkls[i])[0])
+        return list(self.lengths)
+
     def __len__(self):
-        return len(self.poses)
+        return len(self.poses_pkls)
 
     def __getitem__(
         self, index
-    ) -> Tuple[str, str, List[List[List[float]]], List[List[List[float]]]]:
+    ) -> Tuple[
+        Tuple[str, str, List[List[List[float]]], List[List[List[float]]]],
+        Optional[RGBClip],
+    ]:
         """Get item of dataset
 
         Args:
             index (int): index of poses and rgbs
 
         Returns:
-            Tuple[str, str, List[List[List[float]]], List[List[List[float]]]]: subject, action, person keypoints per temporal index [N,15,3], robot keypoints per temporal index [N,9,3]
+            Tuple[Tuple[str, str, List[List[List[float]]], List[List[List[float]]]], Optional[RGBClip]]: (subject, action, person keypoints per temporal index [N,15,3], robot keypoints per temporal index [N,9,3]), lazy RGB of the recording (None if rgb=False or without aligned videos, see CHICORGB.aligned)
         """
         # subject, action, person_kpts, robot_kpts
-        return self.poses[index], None
+        poses = self.get_poses(index)
+        rgb = None
+        if self.rgb is not None and self.rgb.aligned(poses[0], poses[1]):
+            rgb = self.rgb.clip(poses[0], poses[1])
+
+        return poses, rgb
+
+
+class CHICOWindowDataset(CHICODataset):
+    """CHICO sliding windows for pose forecasting
+
+    All the selected recordings are copied once into two preallocated float32
+    tensors (person [N,15,3], robot [N,9,3]) and a flat (sequence, start) index
+    of every window is precomputed, so __len__ counts windows and __getitem__
+    only slices.
+
+    A window spans input_len + output_len frames taken every `skip` frames,
+    consecutive windows of the same recording start `stride` frames apart.
+    Windows never cross recordings. With fps the recordings are first
+    resampled (linear interpolation) from CHICODataset.FPS to fps.
+
+    With rgb=True the RGB frames of the whole window are decoded together with
+    the poses and returned as a fifth uint8 tensor [C,L,H,W,3]; recordings
+    without aligned videos (see CHICORGB.aligned) have no windows.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        input_len: int = 10,
+        output_len: int = 25,
+        stride: int = 1,
+        skip: int = 1,
+        action_filter: Optional[str] = None,
+        subject_filter: Optional[str] = None,
+        fps: Optional[float] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(root, action_filter, subject_filter, **kwargs)
+
+        assert input_len > 0 and output_len >= 0, "Expected positive window lengths"
+        assert stride > 0 and skip > 0, "Expected positive stride and skip"
+
+        self.input_len = input_len
+        self.output_len = output_len
+        self.stride = stride
+        self.skip = skip
+        self.span = (input_len + output_len - 1) * skip + 1
+        self.fps = fps or self.FPS
+        resampled = self.fps != self.FPS
+        assert not (resampled and self.rgb is not None), "RGB frames cannot be resampled"
+
+        n_sequences = len(self.poses_pkls)
+        lengths = [len(self.get_poses(i)[2]) for i in range(n_sequences)]
+        if resampled:
+            lengths = [len(uniform_times(0.0, (n - 1) / self.FPS, self.fps)) for n in lengths]
+        self.offsets = np.zeros(n_sequences + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lengths)
+
+        n_frames = int(self.offsets[-1])
+        self.person = torch.empty((n_frames, 15, 3), dtype=torch.float32)
+        self.robot = torch.empty((n_frames, 9, 3), dtype=torch.float32)
+
+        windows = []
+        # subject, action of every sequence
+        self.names: List[Tuple[str, str]] = []
+        for i in range(n_sequences):
+            subject, action, person_kpts, robot_kpts = self.get_poses(i)
+            self.names.append((subject, action))
+            if resampled:
+                times = np.arange(len(person_kpts)) / self.FPS
+                person_kpts = resample_uniform(times, np.asarray(person_kpts), self.fps).values
+                robot_kpts = resample_uniform(times, np.asarray(robot_kpts), self.fps).values
+            start, end = self.offsets[i], self.offsets[i + 1]
+            self.person[start:end] = torch.from_numpy(
+                np.asarray(person_kpts, dtype=np.float32).reshape(-1, 15, 3)
+            )
+            self.robot[start:end] = torch.from_numpy(
+                np.asarray(robot_kpts, dtype=np.float32).reshape(-1, 9, 3)
+            )
+
+            n_windows = max(0, (lengths[i] - self.span) // stride + 1)
+            if self.rgb is not None and not self.rgb.aligned(subject, action):
+                n_windows = 0
+            starts = start + np.arange(n_windows, dtype=np.int64) * stride
+            windows.append(np.stack([np.full_like(starts, i), starts], axis=1))
+
+        # sequence index, first frame (global) of every window
+        self.windows = (
+            np.concatenate(windows) if windows else np.zeros((0, 2), dtype=np.int64)
+        )
+
+        print(f"Found {len(self.windows)} windows")
+
+    def __len__(self):
+        return len(self.windows)
+
+    def __getitem__(
+        self, index
+    ) -> Tuple[torch.Tensor, ...]:
+        """Get a forecasting window
+
+        Args:
+            index (int): window index
+
+        Returns:
+            Tuple[torch.Tensor, ...]: person input [input_len,15,3], person target [output_len,15,3], robot input [input_len,9,3], robot target [output_len,9,3]. These are views of the preallocated tensors. With rgb=True also the RGB frames [C,input_len+output_len,H,W,3].
+        """
+        seq, start = (int(v) for v in self.windows[index])
+        frames = slice(start, start + self.span, self.skip)
+
+        person = self.person[frames]
+        robot = self.robot[frames]
+
+        n = self.input_len
+        if self.rgb is None:
+            return person[:n], person[n:], robot[:n], robot[n:]
+
+        subject, action = self.names[seq]
+        first = start - int(self.offsets[seq])
+        pose_frames = range(first, first + self.span, self.skip)
+        rgb = torch.from_numpy(self.rgb.read(subject, action, pose_frames))
+
+        return person[:n], person[n:], robot[:n], robot[n:], rgb
 
 
 def __test__():
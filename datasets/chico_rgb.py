@@ -0,0 +1,323 @@
+import os
+import glob
+import json
+import bisect
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from datasets.lru_cache import ByteLRUCache
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+VIDEO_INDEX_VERSION = 1
+
+
+def _require_av():
+    if av is None:
+        raise ImportError("RGB loading requires PyAV: pip install av")
+
+
+class VideoIndex:
+    """Seek index of a video, built by demuxing the packets (no decoding)
+
+    Stores the presentation timestamp of every frame (in presentation order)
+    and which frames are keyframes. It is saved next to the video as
+    <video>.index.json and rebuilt when the video changes.
+    """
+
+    def __init__(self, path: str) -> None:
+        _require_av()
+        self.path = path
+        index_path = os.path.splitext(path)[0] + ".index.json"
+
+        st = os.stat(path)
+        fingerprint = [st.st_size, st.st_mtime_ns]
+
+        index = None
+        if os.path.isfile(index_path):
+            with open(index_path, "r") as fp:
+                index = json.load(fp)
+            if (
+                index.get("version") != VIDEO_INDEX_VERSION
+                or index.get("fingerprint") != fingerprint
+            ):
+                index = None
+
+        if index is None:
+            index = self.build(path)
+            index["version"] = VIDEO_INDEX_VERSION
+            index["fingerprint"] = fingerprint
+            try:
+                with open(index_path, "w") as fp:
+                    json.dump(index, fp)
+            except OSError:
+                print(f"Cannot write {index_path}, the video index is kept in memory")
+
+        self.fps: float = index["fps"]
+        self.width: int = index["width"]
+        self.height: int = index["height"]
+        self.pts: List[int] = index["pts"]
+        self.keyframes: List[int] = index["keyframes"]
+        self.frame_of_pts: Dict[int, int] = {p: i for i, p in enumerate(self.pts)}
+
+    @staticmethod
+    def build(path: str) -> Dict:
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            packets = [
+                (packet.pts, packet.is_keyframe)
+                for packet in container.demux(stream)
+                if packet.pts is not None
+            ]
+            fps = float(stream.average_rate) if stream.average_rate else 25.0
+            width, height = stream.codec_context.width, stream.codec_context.height
+
+        packets.sort()
+        return {
+            "fps": fps,
+            "width": width,
+            "height": height,
+            "pts": [p for p, _ in packets],
+            "keyframes": [i for i, (_, k) in enumerate(packets) if k],
+        }
+
+    def __len__(self) -> int:
+        return len(self.pts)
+
+    def keyframe_before(self, frame: int) -> int:
+        i = bisect.bisect_right(self.keyframes, frame) - 1
+        return self.keyframes[max(i, 0)] if self.keyframes else 0
+
+    def keyframe_after(self, frame: int) -> int:
+        i = bisect.bisect_right(self.keyframes, frame)
+        return self.keyframes[i] if i < len(self.keyframes) else len(self.pts)
+
+
+class VideoReader:
+    """Random access to the frames of a video
+
+    Only the GOPs containing the requested frames are decoded: the reader
+    seeks to the keyframe preceding a frame unless it can keep decoding
+    forward without crossing another keyframe. Frames are optionally
+    downscaled at decode time (by swscale) and kept in a byte bounded cache.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        scale: float = 1.0,
+        cache: Optional[ByteLRUCache] = None,
+    ) -> None:
+        _require_av()
+        self.path = path
+        self.index = VideoIndex(path)
+        self.scale = scale
+        self.width = max(2, int(round(self.index.width * scale)) // 2 * 2)
+        self.height = max(2, int(round(self.index.height * scale)) // 2 * 2)
+        self.cache = cache if cache is not None else ByteLRUCache(256 * 1024 * 1024)
+
+        self.container = None
+        self.decoder = None
+        self.position = -1  # last decoded frame
+
+    def __getstate__(self):
+        # containers cannot be pickled (DataLoader workers), they are reopened lazily
+        state = self.__dict__.copy()
+        state["container"] = None
+        state["decoder"] = None
+        state["position"] = -1
+        return state
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _seek(self, frame: int) -> None:
+        if self.container is None:
+            self.container = av.open(self.path)
+            self.container.streams.video[0].thread_type = "AUTO"
+
+        stream = self.container.streams.video[0]
+        key = self.index.keyframe_before(frame)
+        self.container.seek(self.index.pts[key], stream=stream, backward=True)
+        self.decoder = self.container.decode(stream)
+        self.position = key - 1
+
+    def _to_array(self, frame) -> np.ndarray:
+        if self.scale != 1.0:
+            frame = frame.reformat(width=self.width, height=self.height, format="rgb24")
+            return frame.to_ndarray()
+        return frame.to_ndarray(format="rgb24")
+
+    def read(self, frames: Sequence[int]) -> np.ndarray:
+        """Decode the requested frames
+
+        Args:
+            frames (Sequence[int]): frame numbers, clipped to the video length
+
+        Returns:
+            np.ndarray: uint8 RGB frames [N,H,W,3]
+        """
+        n = len(self.index)
+        frames = [min(max(int(f), 0), n - 1) for f in frames]
+
+        decoded: Dict[int, np.ndarray] = {}
+        for f in frames:
+            img = self.cache.get((self.path, self.scale, f))
+            if img is not None:
+                decoded[f] = img
+
+        for target in sorted(set(frames) - decoded.keys()):
+            # keep decoding forward only if no keyframe is crossed before target
+            if (
+                self.decoder is None
+                or target <= self.position
+                or self.index.keyframe_after(self.position) <= target
+            ):
+                self._seek(target)
+
+            for frame in self.decoder:
+                self.position = self.index.frame_of_pts.get(frame.pts, self.position + 1)
+                if self.position >= target:
+                    break
+            else:
+                self.decoder = None
+                raise RuntimeError(f"Frame {target} not found in {self.path}")
+
+            img = self._to_array(frame)
+            self.cache.put((self.path, self.scale, target), img)
+            decoded[target] = img
+
+        if len(frames) == 0:
+            return np.zeros((0, self.height, self.width, 3), dtype=np.uint8)
+        return np.stack([decoded[f] for f in frames])
+
+    def close(self) -> None:
+        if self.container is not None:
+            self.container.close()
+        self.container = None
+        self.decoder = None
+        self.position = -1
+
+
+class CHICORGB:
+    """Multi-camera RGB of the CHICO dataset
+
+    Supported layouts:
+        rgb/Sxx/<action>/<camera>.mp4   one video per camera and action, aligned with
+                                        the poses of the action
+        rgb/Sxx/<camera>.mp4            one video per camera for the whole subject session
+                                        (as distributed), only aligned with an action listed
+                                        in rgb/Sxx/offsets.json ({"hammer": 1234, ...}, its
+                                        first video frame). CHICO does not ship this file,
+                                        it has to be written by the user.
+
+    Pose frame t of an action is mapped by time to video frame
+    offset + round(t * video_fps / pose_fps), offset is 0 for per-action videos.
+    Recordings without aligned videos are reported by aligned().
+    """
+
+    def __init__(
+        self,
+        rgb_path: str,
+        pose_fps: float = 25.0,
+        scale: float = 1.0,
+        max_cache_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        _require_av()
+        self.rgb_path = rgb_path
+        self.pose_fps = pose_fps
+        self.scale = scale
+        self.cache = ByteLRUCache(max_cache_bytes)
+        self.readers: Dict[str, VideoReader] = {}
+        self.offsets: Dict[str, Dict[str, int]] = {}
+        self.warned: set = set()
+
+    def videos(self, subject: str, action: str) -> List[str]:
+        per_action = sorted(glob.glob(os.path.join(self.rgb_path, subject, action, "*.mp4")))
+        if per_action:
+            return per_action
+        return sorted(glob.glob(os.path.join(self.rgb_path, subject, "*.mp4")))
+
+    def _session_offsets(self, subject: str) -> Dict[str, int]:
+        if subject not in self.offsets:
+            self.offsets[subject] = {}
+            path = os.path.join(self.rgb_path, subject, "offsets.json")
+            if os.path.isfile(path):
+                with open(path, "r") as fp:
+                    self.offsets[subject] = json.load(fp)
+        return self.offsets[subject]
+
+    def aligned(self, subject: str, action: str) -> bool:
+        """True if the videos of an action can be paired with its poses"""
+        if glob.glob(os.path.join(self.rgb_path, subject, action, "*.mp4")):
+            return True
+        if action in self._session_offsets(subject):
+            return len(self.videos(subject, action)) > 0
+
+        if subject not in self.warned and self.videos(subject, action):
+            self.warned.add(subject)
+            print(
+                f"RGB of {subject} is one session video per camera without "
+                f"{os.path.join(self.rgb_path, subject, 'offsets.json')}: its actions have no RGB"
+            )
+        return False
+
+    def offset(self, subject: str, action: str) -> int:
+        if os.path.isdir(os.path.join(self.rgb_path, subject, action)):
+            return 0
+        offsets = self._session_offsets(subject)
+        if action not in offsets:
+            # guessing 0 would pair the poses with the frames of another action
+            path = os.path.join(self.rgb_path, subject, "offsets.json")
+            raise RuntimeError(
+                f"No video offset of {subject} {action}: session videos need {path} "
+                f'with the first video frame of every action, e.g. {{"{action}": 1234}}'
+            )
+        return int(offsets[action])
+
+    def reader(self, path: str) -> VideoReader:
+        if path not in self.readers:
+            self.readers[path] = VideoReader(path, self.scale, self.cache)
+        return self.readers[path]
+
+    def read(self, subject: str, action: str, pose_frames: Sequence[int]) -> np.ndarray:
+        """RGB frames of all the cameras matching some pose frames
+
+        Returns:
+            np.ndarray: uint8 [C,N,H,W,3], C cameras sorted by file name
+        """
+        offset = self.offset(subject, action)
+        res = []
+        for path in self.videos(subject, action):
+            reader = self.reader(path)
+            ratio = reader.index.fps / self.pose_fps
+            res.append(reader.read([offset + int(round(t * ratio)) for t in pose_frames]))
+
+        if len(res) == 0:
+            raise RuntimeError(f"No RGB videos found for {subject} {action}")
+        return np.stack(res)
+
+    def clip(self, subject: str, action: str) -> "RGBClip":
+        return RGBClip(self, subject, action)
+
+    def close(self) -> None:
+        for r in self.readers.values():
+            r.close()
+
+
+class RGBClip:
+    """Lazy RGB handle of a recording, nothing is decoded until read() is called"""
+
+    def __init__(self, rgb: CHICORGB, subject: str, action: str) -> None:
+        self.rgb = rgb
+        self.subject = subject
+        self.action = action
+
+    def read(self, pose_frames: Sequence[int]) -> np.ndarray:
+        return self.rgb.read(self.subject, self.action, pose_frames)
+
+    def __repr__(self) -> str:
+        return f"RGBClip({self.subject}, {self.action})"
@@ -0,0 +1,179 @@
+import math
+import random
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+from torch.utils.data.sampler import Sampler
+
+
+def empty_batch(
+    shape: Sequence[int], dtype: torch.dtype = torch.float32, pin_memory: bool = False
+) -> torch.Tensor:
+    """Uninitialized batch tensor, filled in place by the collate functions
+
+    Inside a DataLoader worker it is allocated in shared memory (as torch
+    default_collate does) so it is handed to the main process without copies;
+    in the main process it can be allocated in pinned memory.
+    """
+    if get_worker_info() is not None:
+        return torch.empty(tuple(shape), dtype=dtype).share_memory_()
+
+    pin_memory = pin_memory and torch.cuda.is_available()
+    return torch.empty(tuple(shape), dtype=dtype, pin_memory=pin_memory)
+
+
+def _copy_into(dst: torch.Tensor, x: Any) -> None:
+    """Copy a tensor, array or nested list into a slice of a CPU batch
+
+    Arrays are copied by numpy: wrapping read-only memmaps (columnar poses,
+    cache hits) in a tensor would warn about non-writable arrays.
+    """
+    if isinstance(x, torch.Tensor):
+        dst.copy_(x)
+    else:
+        np.copyto(dst.numpy(), np.asarray(x), casting="same_kind")
+
+
+class WindowCollate:
+    """Collate for CHICOWindowDataset
+
+    Every field (person/robot input/target, RGB clip) is stacked with a single
+    copy into a contiguous [B,...] tensor of the field dtype (float32 poses,
+    uint8 RGB, bool masks of BeFineWindowDataset).
+    """
+
+    def __init__(self, pin_memory: bool = False) -> None:
+        self.pin_memory = pin_memory
+
+    def __call__(
+        self, batch: List[Tuple[torch.Tensor, ...]]
+    ) -> Tuple[torch.Tensor, ...]:
+        res = []
+        for field in zip(*batch):
+            out = empty_batch(
+                (len(field),) + tuple(field[0].shape),
+                dtype=field[0].dtype,
+                pin_memory=self.pin_memory,
+            )
+            torch.stack(field, out=out)
+            res.append(out)
+        return tuple(res)
+
+
+class SequenceCollate:
+    """Collate for CHICODataset (whole recordings of different lengths)
+
+    Recordings are zero padded to the longest one of the batch.
+
+    Returns:
+        Tuple[List[str], List[str], torch.Tensor, torch.Tensor, torch.Tensor]: subjects, actions, person keypoints [B,T,15,3], robot keypoints [B,T,9,3], lengths [B]
+    """
+
+    def __init__(self, pin_memory: bool = False) -> None:
+        self.pin_memory = pin_memory
+
+    def __call__(self, batch: List[Tuple[Tuple[str, str, Any, Any], Any]]):
+        poses = [b[0] for b in batch]
+        subjects = [p[0] for p in poses]
+        actions = [p[1] for p in poses]
+        person = [p[2] for p in poses]
+        robot = [p[3] for p in poses]
+
+        lengths = torch.tensor([len(p) for p in person], dtype=torch.int64)
+        t = int(lengths.max()) if len(batch) > 0 else 0
+
+        person_batch = empty_batch((len(batch), t, 15, 3), pin_memory=self.pin_memory)
+        robot_batch = empty_batch((len(batch), t, 9, 3), pin_memory=self.pin_memory)
+        for i, n in enumerate(lengths.tolist()):
+            _copy_into(person_batch[i, :n], person[i])
+            person_batch[i, n:] = 0
+            _copy_into(robot_batch[i, :n], robot[i])
+            robot_batch[i, n:] = 0
+
+        return subjects, actions, person_batch, robot_batch, lengths
+
+
+class BeFineCollate:
+    """Collate for BeFineDataset(as_arrays=True) frames
+
+    Bodies are NaN padded to the most crowded frame of the batch.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor, torch.Tensor]: timestamps [B], keypoints [B,P,18,3], bodies per frame [B]
+    """
+
+    def __init__(self, pin_memory: bool = False) -> None:
+        self.pin_memory = pin_memory
+
+    def __call__(self, batch: List[Tuple[int, np.ndarray]]):
+        timestamps = torch.tensor([b[0] for b in batch], dtype=torch.int64)
+        counts = torch.tensor([len(b[1]) for b in batch], dtype=torch.int64)
+        p = int(counts.max()) if len(batch) > 0 else 0
+        j = batch[0][1].shape[1] if len(batch) > 0 else 0
+
+        keypoints = empty_batch((len(batch), p, j, 3), pin_memory=self.pin_memory)
+        keypoints.fill_(float("nan"))
+        for i, (_, bodies) in enumerate(batch):
+            if len(bodies) > 0:
+                _copy_into(keypoints[i, : len(bodies)], bodies)
+
+        return timestamps, keypoints, counts
+
+
+class LengthBucketSampler(Sampler):
+    """Batch sampler grouping items of similar length to reduce padding
+
+    Indices are shuffled, split into buckets of bucket_size batches, sorted by
+    length inside each bucket and cut into batches; the order of the batches is
+    shuffled again. Use it as DataLoader(batch_sampler=...).
+    """
+
+    def __init__(
+        self,
+        lengths: Sequence[int],
+        batch_size: int,
+        bucket_size: int = 50,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: Optional[int] = None,
+    ) -> None:
+        assert batch_size > 0 and bucket_size > 0, "Expected positive sizes"
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.rng = random.Random(seed)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        indices = np.arange(len(self.lengths))
+        if self.shuffle:
+            indices = indices[self.rng.sample(range(len(indices)), len(indices))]
+
+        step = self.batch_size * self.bucket_size
+        batches: List[List[int]] = []
+        for start in range(0, len(indices), step):
+            bucket = indices[start : start + step]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind="stable")]
+            for b in range(0, len(bucket), self.batch_size):
+                batches.append(bucket[b : b + self.batch_size].tolist())
+
+        if self.drop_last:
+            batches = [b for b in batches if len(b) == self.batch_size]
+        if self.shuffle:
+            self.rng.shuffle(batches)
+
+        return iter(batches)
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            # only the last batch of every bucket can be incomplete
+            n = len(self.lengths)
+            step = self.batch_size * self.bucket_size
+            full_buckets, rest = divmod(n, step)
+            return full_buckets * self.bucket_size + rest // self.batch_size
+        return sum(
+            math.ceil(min(self.batch_size * self.bucket_size, len(self.lengths) - s) / self.batch_size)
+            for s in range(0, len(self.lengths), self.batch_size * self.bucket_size)
+        )
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import numpy as np
+
+
+def nbytes_of(value: Any) -> int:
+    """Approximate memory footprint of numpy arrays, possibly nested in tuples/lists"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    return 0
+
+
+class ByteLRUCache:
+    """Least-recently-used cache bounded by a byte budget
+
+    The least recently accessed entries are evicted until the total size fits
+    max_bytes. A single entry larger than the budget is returned but not kept.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        assert max_bytes >= 0, "Expected a non negative byte budget"
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.items: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.items
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if key not in self.items:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.items.move_to_end(key)
+        return self.items[key][0]
+
+    def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None) -> None:
+        if nbytes is None:
+            nbytes = nbytes_of(value)
+
+        if key in self.items:
+            self.current_bytes -= self.items.pop(key)[1]
+
+        if nbytes > self.max_bytes:
+            return
+
+        self.items[key] = (value, nbytes)
+        self.current_bytes += nbytes
+
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted) = self.items.popitem(last=False)
+            self.current_bytes -= evicted
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        self.items.clear()
+        self.current_bytes = 0
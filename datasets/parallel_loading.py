@@ -0,0 +1,91 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterator, List, Sequence, Tuple
+import numpy as np
+from tqdm import tqdm
+
+
+# (shared memory name, shape, dtype)
+SharedArrayHandle = Tuple[str, Tuple[int, ...], str]
+
+
+def _to_shared(arrays: Sequence[np.ndarray]) -> List[SharedArrayHandle]:
+    handles: List[SharedArrayHandle] = []
+    try:
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+            handles.append((shm.name, a.shape, a.dtype.str))
+            np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+            shm.close()
+            # the parent owns (and unlinks) the block, the worker must not track it
+            resource_tracker.unregister(shm._name, "shared_memory")
+    except BaseException:
+        _release(handles)
+        raise
+    return handles
+
+
+def _from_shared(handles: List[SharedArrayHandle]) -> Tuple[np.ndarray, ...]:
+    arrays = []
+    try:
+        for i, (name, shape, dtype) in enumerate(handles):
+            shm = SharedMemory(name=name)
+            # a single memcpy into the parent memory, no unpickling of the content
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy())
+            shm.close()
+            shm.unlink()
+    except BaseException:
+        _release(handles[i:])
+        raise
+    return tuple(arrays)
+
+
+def _release(handles: List[SharedArrayHandle]) -> None:
+    for name, _, _ in handles:
+        try:
+            shm = SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+def _worker(args: Tuple[Callable[[str], Sequence[np.ndarray]], str]):
+    loader, path = args
+    return _to_shared(loader(path))
+
+
+def parallel_load(
+    loader: Callable[[str], Sequence[np.ndarray]],
+    paths: List[str],
+    num_workers: int,
+    progress: bool = True,
+) -> Iterator[Tuple[np.ndarray, ...]]:
+    """Parse files on a process pool, results are moved through shared memory
+
+    Workers run `loader(path)` and write the returned numpy arrays into shared
+    memory blocks; only their names travel back through the pool, so the parent
+    does not deserialize the parsed content a second time.
+
+    Args:
+        loader (Callable[[str], Sequence[np.ndarray]]): module level (picklable) function returning a tuple of arrays
+        paths (List[str]): files to parse
+        num_workers (int): size of the process pool
+        progress (bool, optional): show a tqdm bar. Defaults to True.
+
+    Yields:
+        Tuple[np.ndarray, ...]: the arrays returned by loader, in the order of paths
+    """
+    assert num_workers > 0, "Expected at least one worker"
+
+    if len(paths) == 0:
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        results = executor.map(_worker, [(loader, p) for p in paths])
+        if progress:
+            results = tqdm(results, total=len(paths))
+        for handles in results:
+            yield _from_shared(handles)
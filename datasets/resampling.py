@@ -0,0 +1,163 @@
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+
+class Resampled(NamedTuple):
+    # seconds, [M] uniformly spaced
+    times: np.ndarray
+    # [M,...,D], NaN where mask is False
+    values: np.ndarray
+    # [M,...], True where the value is interpolated between two valid samples
+    mask: np.ndarray
+
+
+def uniform_times(start: float, end: float, fps: float) -> np.ndarray:
+    """Times start, start + 1/fps, ... up to end (included when it falls on the grid)"""
+    assert fps > 0, "Expected a positive frame rate"
+    if end < start:
+        return np.zeros(0, dtype=np.float64)
+    # the epsilon keeps end on the grid despite the rounding of (end - start) * fps
+    n = int(np.floor((end - start) * fps + 1e-6)) + 1
+    return start + np.arange(n, dtype=np.float64) / fps
+
+
+def resample(
+    times: Sequence[float],
+    values: np.ndarray,
+    target_times: Sequence[float],
+    max_gap: Optional[float] = None,
+) -> Resampled:
+    """Linear interpolation of a sampled sequence at target_times, in one array pass
+
+    Every element (e.g. joint) is interpolated between its own closest valid
+    samples before and after the target time: samples with a NaN coordinate
+    (null joints, absent bodies) are skipped, not propagated.
+    A target time is masked (values NaN, mask False) when it is outside the
+    valid samples of the element or when the two samples are more than
+    max_gap seconds apart.
+
+    Args:
+        times (Sequence[float]): sample times [T], seconds, non decreasing
+        values (np.ndarray): samples [T,...,D], e.g. keypoints [T,J,3] or tracks [T,B,J,3]
+        target_times (Sequence[float]): times to sample [M], seconds
+        max_gap (Optional[float], optional): longest interval that is interpolated, seconds. Defaults to None, no limit.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    target = np.asarray(target_times, dtype=np.float64)
+    values = np.asarray(values)
+    assert len(times) == len(values), "Expected one time per sample"
+    assert np.all(np.diff(times) >= 0), "Expected non decreasing sample times"
+
+    n, m = len(times), len(target)
+    elem_shape, dim = values.shape[1:-1], values.shape[-1]
+    dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+    if n == 0:
+        return Resampled(
+            target,
+            np.full((m,) + values.shape[1:], np.nan, dtype=dtype),
+            np.zeros((m,) + elem_shape, dtype=bool),
+        )
+
+    flat = values.reshape(n, -1, dim)  # [T,K,D]
+    valid = np.isfinite(flat).all(axis=-1)  # [T,K]
+
+    # last valid sample at or before every frame, first valid sample at or after it
+    rows = np.arange(n)[:, None]
+    prev_valid = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    next_valid = np.minimum.accumulate(np.where(valid, rows, n)[::-1], axis=0)[::-1]
+
+    before = np.searchsorted(times, target, side="right") - 1  # last frame at or before
+    after = np.searchsorted(times, target, side="left")  # first frame at or after
+    left = np.where(
+        (before >= 0)[:, None], prev_valid[np.clip(before, 0, n - 1)], -1
+    )  # [M,K]
+    right = np.where(
+        (after < n)[:, None], next_valid[np.clip(after, 0, n - 1)], n
+    )  # [M,K]
+
+    has_left, has_right = left >= 0, right < n
+    left_c, right_c = np.clip(left, 0, n - 1), np.clip(right, 0, n - 1)
+    t_left, t_right = times[left_c], times[right_c]
+
+    exact = has_left & (t_left == target[:, None])
+    mask = exact | (has_left & has_right)
+    if max_gap is not None:
+        mask &= exact | (t_right - t_left <= max_gap)
+
+    span = t_right - t_left
+    alpha = np.where(
+        has_right & (span > 0), (target[:, None] - t_left) / np.where(span > 0, span, 1.0), 0.0
+    )
+
+    cols = np.arange(flat.shape[1])[None, :]
+    a = flat[left_c, cols].astype(dtype)  # [M,K,D]
+    b = flat[right_c, cols].astype(dtype)
+    b = np.where(has_right[..., None], b, a)
+    res = a + alpha[..., None].astype(dtype) * (b - a)
+    res[~mask] = np.nan
+
+    return Resampled(
+        target, res.reshape((m,) + values.shape[1:]), mask.reshape((m,) + elem_shape)
+    )
+
+
+def resample_uniform(
+    times: Sequence[float],
+    values: np.ndarray,
+    fps: float,
+    max_gap: Optional[float] = None,
+) -> Resampled:
+    """resample() on a fps grid from the first to the last sample time"""
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) == 0:
+        return resample(times, values, np.zeros(0), max_gap)
+    return resample(times, values, uniform_times(times[0], times[-1], fps), max_gap)
+
+
+def align_streams(
+    streams: Sequence[Tuple[Sequence[float], np.ndarray]],
+    fps: float,
+    max_gap: Optional[float] = None,
+) -> List[Resampled]:
+    """Resample separately timestamped streams (e.g. human and robot) on one common grid
+
+    The grid covers the interval where all the streams have samples, times in
+    the same clock (seconds) for every stream.
+
+    Args:
+        streams (Sequence[Tuple[Sequence[float], np.ndarray]]): (times [T_i], values [T_i,...,D]) of every stream
+        fps (float): rate of the common grid
+        max_gap (Optional[float], optional): see resample. Defaults to None.
+
+    Returns:
+        List[Resampled]: one per stream, all with the same times
+    """
+    times = [np.asarray(t, dtype=np.float64) for t, _ in streams]
+    assert all(len(t) > 0 for t in times), "Expected at least one sample per stream"
+    start = max(t[0] for t in times)
+    end = min(t[-1] for t in times)
+    grid = uniform_times(start, end, fps)
+    return [resample(t, v, grid, max_gap) for t, (_, v) in zip(times, streams)]
+
+
+def resample_befine(
+    seq, fps: float, max_gap: Optional[float] = None, unit: float = 1e-3
+) -> Tuple[np.ndarray, Resampled]:
+    """Body tracks of a BeFineSequence on a fps grid
+
+    Frames without bodies only contribute their timestamp; a body is masked
+    where it is absent for more than max_gap seconds.
+
+    Args:
+        seq (BeFineSequence): recording
+        fps (float): output frame rate
+        max_gap (Optional[float], optional): see resample. Defaults to None.
+        unit (float, optional): seconds per timestamp tick. Defaults to 1e-3 (milliseconds).
+
+    Returns:
+        Tuple[np.ndarray, Resampled]: body ids [B], tracks with values [M,B,18,3] and mask [M,B,18]
+    """
+    ids, tracks = seq.tracks()
+    # recordings are not guaranteed to be in timestamp order
+    order = np.argsort(seq.timestamps, kind="stable")
+    return ids, resample_uniform(seq.timestamps[order] * unit, tracks[order], fps, max_gap)
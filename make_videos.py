@@ -1,3 +1,5 @@
+# Encodes JPEG dumps (run/befine_show_poses.py with SAVE_JPEG = True) into videos.
+# The show poses scripts already write the videos with visualizer/video_writer.py.
 from glob import glob
 import os
 
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+
+# HRC_PROFILE=1 prints the report at exit, HRC_PROFILE=path.json writes it as JSON
+PROFILE_ENV = "HRC_PROFILE"
+# HRC_PROFILE_INTERVAL=seconds also reports periodically
+PROFILE_INTERVAL_ENV = "HRC_PROFILE_INTERVAL"
+
+# upper bounds of the histogram buckets (seconds): 10 per decade, 1us to 1000s
+BUCKETS = [10 ** (e / 10) for e in range(-60, 31)]
+
+
+class Histogram:
+    """Counts of the durations of a stage in logarithmic buckets
+
+    Recording is a bisect and a few additions; percentiles are approximated
+    by the upper bound of their bucket (at most ~26% above the true value).
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n > 0 and seen >= rank:
+                bound = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(max(bound, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """Statistics in milliseconds"""
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.mean * 1000,
+            "min_ms": (self.min if self.count else 0.0) * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Profiler:
+    """Per stage duration histograms and named counters of the hot paths
+
+    Stages are dotted names ("chico.read_pickle", "render.update", ...). When
+    disabled, timed() functions pay a single attribute check and timer()
+    returns a shared no-op context manager.
+
+    Only the calling process is measured: worker processes send their
+    collect() to the parent, which merge()s them (see run/batch_export.py).
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+        self.sampler: Optional[threading.Thread] = None
+        self.sampler_stopped = threading.Event()
+        self.exit_registered = False
+
+    def record(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = Histogram()
+            hist.record(seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def _timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timer(self, stage: str):
+        """Context manager timing its block as stage"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(stage)
+
+    def timed(self, stage: str) -> Callable[[Callable], Callable]:
+        """Decorator timing every call of a function as stage"""
+
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def collect(self) -> Tuple[Dict[str, Histogram], Dict[str, int]]:
+        """Take the histograms and counters collected so far (picklable), and start over"""
+        with self.lock:
+            res = (self.stages, self.counters)
+            self.stages, self.counters = {}, {}
+            return res
+
+    def merge(self, stages: Dict[str, Histogram], counters: Dict[str, int]) -> None:
+        """Add the collect() of another process"""
+        with self.lock:
+            for name, hist in stages.items():
+                self.stages.setdefault(name, Histogram()).merge(hist)
+            for name, n in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.start_time = time.time()
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "elapsed_s": time.time() - self.start_time,
+                "pid": os.getpid(),
+                "stages": {k: h.summary() for k, h in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def report(self) -> str:
+        snap = self.snapshot()
+        lines = [f"Profile of the last {snap['elapsed_s']:.1f}s (pid {snap['pid']})"]
+        if snap["stages"]:
+            width = max(len(k) for k in snap["stages"])
+            lines.append(
+                f"{'stage':<{width}} {'count':>8} {'total':>10} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)"
+            )
+            for name, s in snap["stages"].items():
+                lines.append(
+                    f"{name:<{width}} {s['count']:>8} {s['total_ms']:>10.1f} {s['mean_ms']:>9.3f} "
+                    f"{s['p50_ms']:>9.3f} {s['p90_ms']:>9.3f} {s['p99_ms']:>9.3f} {s['max_ms']:>9.3f}"
+                )
+        for name, n in snap["counters"].items():
+            lines.append(f"{name}: {n}")
+        return "\n".join(lines)
+
+    def dump(self, path: Optional[str] = None) -> None:
+        """Write the report as JSON to path, or as text to stderr without a path"""
+        if path is None:
+            print(self.report(), file=sys.stderr)
+            return
+        with open(path, "w") as fp:
+            json.dump(self.snapshot(), fp, indent=2)
+
+    def report_at_exit(self, path: Optional[str] = None) -> None:
+        if not self.exit_registered:
+            self.exit_registered = True
+            atexit.register(self._exit, path)
+
+    def _exit(self, path: Optional[str]) -> None:
+        self.stop_sampling()
+        self.dump(path)
+
+    def start_sampling(self, interval: float, path: Optional[str] = None) -> None:
+        """Dump the report every interval seconds from a daemon thread (JSON files are overwritten)"""
+        self.stop_sampling()
+        self.sampler_stopped.clear()
+
+        def run():
+            while not self.sampler_stopped.wait(interval):
+                self.dump(path)
+
+        self.sampler = threading.Thread(target=run, daemon=True)
+        self.sampler.start()
+
+    def stop_sampling(self) -> None:
+        if self.sampler is not None:
+            self.sampler_stopped.set()
+            self.sampler.join()
+            self.sampler = None
+
+
+_NULL_TIMER = nullcontext()
+
+PROFILER = Profiler()
+timer = PROFILER.timer
+timed = PROFILER.timed
+record = PROFILER.record
+count = PROFILER.count
+
+
+def enable(
+    path: Optional[str] = None,
+    interval: Optional[float] = None,
+    at_exit: bool = True,
+) -> Profiler:
+    """Start collecting
+
+    Args:
+        path (Optional[str], optional): JSON file of the report, stderr text when missing. Defaults to None.
+        interval (Optional[float], optional): also report every interval seconds. Defaults to None.
+        at_exit (bool, optional): report when the interpreter exits. Defaults to True.
+    """
+    PROFILER.enabled = True
+    if at_exit:
+        PROFILER.report_at_exit(path)
+    if interval:
+        PROFILER.start_sampling(interval, path)
+    return PROFILER
+
+
+def disable() -> None:
+    PROFILER.enabled = False
+    PROFILER.stop_sampling()
+
+
+def _enable_from_env() -> None:
+    value = os.environ.get(PROFILE_ENV, "")
+    if value.lower() in ("", "0", "false", "no"):
+        return
+    path = None if value.lower() in ("1", "true", "yes") else value
+    interval = os.environ.get(PROFILE_INTERVAL_ENV)
+    enable(path, float(interval) if interval else None)
+
+
+_enable_from_env()
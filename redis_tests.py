@@ -1,60 +1,53 @@
 from threading import Thread
 import time
-import redis
+import numpy as np
+from streaming.pose_stream import PosePublisher, PoseSubscriber
 
 
 class RedisPublisher(Thread):
-    def __init__(self) -> None:
-        super().__init__()
-        self.redis = redis.Redis("127.0.0.1", 6379, 0)
+    def __init__(self, fps: float = 25) -> None:
+        super().__init__(daemon=True)
+        self.publisher = PosePublisher("__test__", "redis://127.0.0.1:6379/0")
+        self.fps = fps
 
     def run(self) -> None:
-        i = 0
+        # one CHICO-like frame: one person [1,15,3] and the robot [9,3]
         while True:
-            print(f"Publishing: {i}")
-            # self.redis.set("__test__", i)
-            self.redis.publish("__test__", i)
-            i += 1
-            time.sleep(3)
+            people = np.random.rand(1, 15, 3).astype(np.float32)
+            robot = np.random.rand(9, 3).astype(np.float32)
+            seq = self.publisher.publish(people, robot)
+            print(f"Publishing: {seq}")
+            time.sleep(1 / self.fps)
 
 
 class RedisSubscriber(Thread):
     def __init__(self) -> None:
-        super().__init__()
-        self.redis = redis.Redis(
-            "127.0.0.1", 6379, 0, decode_responses=True, charset="utf-8"
-        )
-
-    def get_message(self, timeout):
-        val = None
-        msg = self.sub.get_message(timeout=timeout)
-        while msg is not None:
-            val = msg
-            msg = self.sub.get_message(timeout=timeout)
-        return val
+        super().__init__(daemon=True)
+        self.subscriber = PoseSubscriber("__test__", "redis://127.0.0.1:6379/0")
 
     def run(self) -> None:
-
-        print("Creating subscribing")
-        self.sub = self.redis.pubsub()
-
-        self.sub.subscribe("__test__")
-
         while True:
-
-            val = self.get_message(timeout=0.1)
-            if val is not None:
-                print("Got", val["data"])
-            else:
+            # blocks until a new frame arrives, older unread frames are skipped
+            frame = self.subscriber.latest(timeout=1.0)
+            if frame is None:
                 print("Got None")
-            time.sleep(0.1)
+                continue
+            latency = (time.time() - frame.timestamp) * 1000
+            print(
+                f"Got {frame.seq}: people {frame.people.shape}, robot {frame.robot.shape}, "
+                f"{latency:.2f}ms, {self.subscriber.skipped} skipped"
+            )
 
 
 def main():
-    RedisPublisher().start()
-    RedisSubscriber().start()
-
-    while True:
+    publisher = RedisPublisher()
+    subscriber = RedisSubscriber()
+    publisher.start()
+    subscriber.start()
+
+    try:
+        subscriber.join()
+    except KeyboardInterrupt:
         pass
 
 
@@ -0,0 +1,218 @@
+import os
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from datasets.chico_dataset import CHICODataset
+from datasets.befine.befine_dataset import BeFineIterableDataset
+from datasets.befine.befine_structures import BEFINE_LINKS, BeFineSequence
+from profiling.profiler import PROFILER, enable
+from visualizer.open3d_wrapper import Open3DWrapper
+from visualizer.open3d_scene import Open3DScene
+from visualizer.playback import ChunkedPlayback, Playback, Timeline
+from visualizer.video_writer import VideoWriter
+
+
+# one dataset and one headless renderer per worker process, reused by all its jobs
+_dataset = None
+_wrapper: Optional[Open3DWrapper] = None
+# CHICO item of every (subject, action)
+_chico_items: Dict[Tuple[str, str], int] = {}
+
+
+def _init_worker(dataset: str, root: str, profile: bool) -> None:
+    global _dataset, _wrapper, _chico_items
+
+    # the stages of every job are sent back to the parent with its result
+    PROFILER.stop_sampling()
+    PROFILER.enabled = profile
+
+    if dataset == "chico":
+        # memory mapped: all the workers share the same page cache
+        _dataset = CHICODataset(root, columnar=True)
+        _chico_items = {p[:2]: i for i, p in enumerate(_dataset.poses)}
+    else:
+        _dataset = BeFineIterableDataset(root, chunks=True)
+
+    _wrapper = Open3DWrapper(offscreen=True)
+    _wrapper.initialize_visualizer()
+
+
+def _coordinate_system_location(pts: np.ndarray) -> List[float]:
+    pts = pts[np.isfinite(pts).all(axis=1) & ~np.all(pts == 0, axis=1)]
+    return pts.min(axis=0).tolist() if len(pts) > 0 else [0.0, 0.0, 0.0]
+
+
+def _render_chico(subject: str, action: str, writer: VideoWriter, fps: float) -> int:
+    _, _, all_person_kpts, all_robot_kpts = _dataset.get_poses(_chico_items[(subject, action)])
+    all_person_kpts = np.asarray(all_person_kpts)
+    all_robot_kpts = np.asarray(all_robot_kpts)
+
+    scene = Open3DScene(
+        _wrapper, _dataset.keypoints_links, robot_links=_dataset.kuka_links, radius=20
+    )
+    # the recording rate is resampled to the video rate
+    playback = Playback(
+        Timeline.from_fps(len(all_person_kpts), CHICODataset.FPS), fps=fps, realtime=False
+    )
+    frames = 0
+    for frame in playback:
+        t = frame.index
+        scene.update(all_person_kpts[t][None], all_robot_kpts[t])
+        if frames == 0:
+            _wrapper.create_coordinate_system(_coordinate_system_location(all_person_kpts[t]), 150)
+            _wrapper.set_camera_visualization()
+
+        _wrapper.update()
+        writer.write(_wrapper.capture())
+        frames += 1
+
+    return frames
+
+
+def _render_befine(action_path: str, writer: VideoWriter, fps: float) -> int:
+    frames = 0
+    coordinate_system = None
+    scene = Open3DScene(_wrapper, BEFINE_LINKS, radius=0.5)
+    # the recorded timestamps are resampled to the video rate (nearest earlier frame),
+    # still parsing the file chunk by chunk
+    playback = ChunkedPlayback(
+        BeFineSequence.iter_chunks(action_path, _dataset.chunk_size),
+        # BeFine timestamps are milliseconds
+        unit=1e-3,
+        fps=fps,
+        realtime=False,
+    )
+    for chunk, frame in playback:
+        i = frame.index
+        start, end = chunk.body_offsets[i], chunk.body_offsets[i + 1]
+        bodies = chunk.keypoints[start:end] * 10
+        scene.update(bodies, ids=chunk.body_ids[start:end].tolist())
+        if coordinate_system is None and np.isfinite(bodies).any():
+            coordinate_system = _wrapper.create_coordinate_system(
+                _coordinate_system_location(bodies.reshape(-1, 3)), 5
+            )
+            _wrapper.set_camera_visualization()
+
+        _wrapper.update()
+        writer.write(_wrapper.capture())
+        frames += 1
+
+    return frames
+
+
+def export_job(subject: str, action: str, source: str, output: str, fps: float) -> Dict:
+    """Render one (subject, action) recording into its own video, runs in a worker"""
+    start = time.time()
+    try:
+        with VideoWriter(output, fps=fps) as writer:
+            if isinstance(_dataset, CHICODataset):
+                frames = _render_chico(subject, action, writer, fps)
+            else:
+                frames = _render_befine(source, writer, fps)
+    finally:
+        _wrapper.clear()
+
+    elapsed = time.time() - start
+    res = {
+        "subject": subject,
+        "action": action,
+        "output": output,
+        "frames": frames,
+        "seconds": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+    }
+    if PROFILER.enabled:
+        res["profile"] = PROFILER.collect()
+    return res
+
+
+def list_jobs(
+    dataset: str,
+    root: str,
+    output: str,
+    subjects: Optional[List[str]],
+    actions: Optional[List[str]],
+) -> List[Tuple[str, str, str, str]]:
+    """(subject, action, source, output video) of every recording to export"""
+    jobs = []
+    if dataset == "chico":
+        # only the columnar index is read here
+        chico = CHICODataset(root, columnar=True)
+        for subj, act in sorted(set(p[:2] for p in chico.poses)):
+            if subjects and subj not in subjects:
+                continue
+            if actions and act not in actions:
+                continue
+            jobs.append((subj, act, "", os.path.join(output, subj, f"{act}.mp4")))
+    else:
+        for action_path in BeFineIterableDataset(root).action_files:
+            subj = action_path.split(os.sep)[-3]
+            act = os.path.splitext(os.path.basename(action_path))[0]
+            if subjects and subj not in subjects:
+                continue
+            if actions and not any(a in act for a in actions):
+                continue
+            jobs.append((subj, act, action_path, os.path.join(output, subj, f"{act}.mp4")))
+
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render every (subject, action) recording into a video on a pool of headless renderers"
+    )
+    parser.add_argument("--dataset", choices=["chico", "befine"], default="chico")
+    parser.add_argument("--root", default=None, help="defaults to data/chico or data/godot")
+    parser.add_argument("--output", default="output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--fps", type=float, default=None, help="video rate, defaults to 25 (CHICO) or 8 (BeFine); recordings are resampled to it")
+    parser.add_argument("--subjects", nargs="*", default=None)
+    parser.add_argument("--actions", nargs="*", default=None)
+    parser.add_argument("--profile", nargs="?", const="", default=None, help="report the time of every stage at exit, as JSON when a path is given")
+    args = parser.parse_args()
+
+    if args.profile is not None:
+        enable(args.profile or None)
+
+    root = args.root or ("data/chico" if args.dataset == "chico" else "data/godot")
+    fps = args.fps or (CHICODataset.FPS if args.dataset == "chico" else 8)
+
+    jobs = list_jobs(args.dataset, root, args.output, args.subjects, args.actions)
+    print(f"Exporting {len(jobs)} recordings with {args.workers} workers")
+
+    start = time.time()
+    total_frames = 0
+    # spawn: renderers must not inherit GL state from the parent
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.dataset, root, PROFILER.enabled),
+    ) as executor:
+        futures = {
+            executor.submit(export_job, subj, act, source, out, fps): (subj, act)
+            for subj, act, source, out in jobs
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            subj, act = futures[future]
+            try:
+                res = future.result()
+            except Exception as e:
+                print(f"[{n}/{len(jobs)}] {subj} {act} FAILED: {e}")
+                continue
+            total_frames += res["frames"]
+            if "profile" in res:
+                PROFILER.merge(*res["profile"])
+            print(
+                f"[{n}/{len(jobs)}] {subj} {act}: {res['frames']} frames in {res['seconds']:.1f}s ({res['fps']:.1f} FPS) -> {res['output']}"
+            )
+
+    elapsed = time.time() - start
+    print(f"Done: {total_frames} frames in {elapsed:.1f}s ({total_frames / max(elapsed, 1e-9):.1f} FPS overall)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
-import os
 import numpy as np
-from datasets.befine.befine_dataset import BeFineDataset
-from datasets.befine.befine_structures import BeFineBody
+from datasets.befine.befine_dataset import BeFineIterableDataset
+from datasets.befine.befine_structures import BEFINE_LINKS, BeFineSequence
 from visualizer.open3d_wrapper import Open3DWrapper
+from visualizer.open3d_scene import Open3DScene
+from visualizer.playback import ChunkedPlayback
+from visualizer.video_writer import VideoWriter
 
 
 def main():
     FPS = 8
+    # playback speed of the recorded timestamps
+    SPEED = 1.0
+    # True: render without a window (headless servers), frames are only saved;
+    # the recording is then resampled to FPS instead of played in real time
+    OFFSCREEN = False
+    # True: also dump every frame as output/<action>/<i>.jpg (debug)
+    SAVE_JPEG = False
 
     camera_position_set = False
-    wrapper = Open3DWrapper()
+    wrapper = Open3DWrapper(offscreen=OFFSCREEN)
     wrapper.initialize_visualizer()
 
     # all_actions = CHICODataset.actions
@@ -35,77 +44,57 @@ def main():
         for action in all_actions:
             print("Running action: ", action)
             
-            befine = BeFineDataset(
-                "data/godot", subj, action
-            )
-            links = [
-                [3,4],
-                [3,5],
-                [4,6],
-                [5,7],
-                [6,8],
-                [9,3],
-                [10,4],
-                [11,9],
-                [12,10],
-                [11,13],
-                [12,14],
-                [0,16],
-            ]
+            befine = BeFineIterableDataset("data/godot", subj, action)
+            links = BEFINE_LINKS
             coordinate_system = None
-            skeleton = None
+            # all the bodies of a frame, skeletons are reused as people come and go
+            scene = Open3DScene(wrapper, links, radius=0.5)
 
-            for ii, data in enumerate(befine):
-                # assert len(data.bodies) < 2
-                if len(data.bodies) == 0:
-                    person_kpts = []
-                else:
-                    body: BeFineBody = data.bodies[0]
-                    person_kpts = body.to_keypoints(scale=10)
-                
-                if len(person_kpts) != 0:  # ho davvero una persona
-                    # not show NaN / None keypoints
-                    # idxs = [i for i, k in enumerate(person_kpts) if np.isnan(k).all()]
-                    # new_links = np.asarray([l for l in links if l[0] not in idxs and l[1] not in idxs])
-                    # new_links -= len(idxs)
-                    # new_links = new_links.tolist()
-                    # person_kpts = [p for i, p in enumerate(person_kpts) if i not in idxs]
+            # frames are encoded while rendering, no JPEG round trip through make_videos.py
+            writer = VideoWriter(
+                f"output/{action}.mp4",
+                fps=FPS,
+                jpeg_dir=f"output/{action}" if SAVE_JPEG else None,
+            )
 
-                    # Create / Update person skeleton
-                    if skeleton is None:
-                        skeleton = wrapper.create_skeleton(person_kpts, links, radius=0.5)
-                    else:
-                        skeleton.update(person_kpts)
+            for action_path in befine.action_files:
+                # frames are scheduled chunk by chunk while the file is parsed,
+                # so the first poses show up before the whole file is read
+                playback = ChunkedPlayback(
+                    BeFineSequence.iter_chunks(action_path),
+                    # BeFine timestamps are milliseconds
+                    unit=1e-3,
+                    speed=SPEED,
+                    fps=FPS,
+                    realtime=not OFFSCREEN,
+                )
+                for seq, frame in playback:
+                    ii = frame.index
+                    start, end = seq.body_offsets[ii], seq.body_offsets[ii + 1]
+                    # [P,18,3], NaN keypoints are hidden by the scene
+                    bodies = seq.keypoints[start:end] * 10
+                    scene.update(bodies, ids=seq.body_ids[start:end].tolist())
 
                     # Add coordinate system
-                    if coordinate_system is None:
-                        pts = np.asarray(person_kpts)
-                        pts = pts[~np.all(pts == 0, axis=1)]
-                        loc = [
-                            np.min(pts[:, 0]).item(),
-                            np.min(pts[:, 1]).item(),
-                            np.min(pts[:, 2]).item(),
-                        ]
+                    if coordinate_system is None and np.isfinite(bodies).any():
+                        loc = np.nanmin(bodies.reshape(-1, 3), axis=0).tolist()
                         coordinate_system = wrapper.create_coordinate_system(loc, 5)
 
-                wrapper.update()
-                wrapper.wait(1 / FPS)
+                    wrapper.update()
+
+                    if not camera_position_set:
+                        wrapper.set_camera_visualization()
+                        camera_position_set = True
 
-                if not camera_position_set:
-                    wrapper.set_camera_visualization()
-                    camera_position_set = True
+                    writer.write(wrapper.capture())
 
-                d = f"output/{action}"
-                if not os.path.isdir(d):
-                    os.makedirs(d)
-                wrapper.save(f"{d}/{ii}.jpg")
+                print(f"{action_path}: {playback.stats}")
 
+            writer.close()
             wrapper.clear()
+            scene.clear()
             
             # Clear view variables
-            del skeleton
-            skeleton = None
-            del coordinate_system
             coordinate_system = None
             camera_position_set = False
 
@@ -1,10 +1,17 @@
 import numpy as np
 from datasets.chico_dataset import CHICODataset
 from visualizer.open3d_wrapper import Open3DWrapper
+from visualizer.open3d_scene import Open3DScene
+from visualizer.playback import Playback, Timeline, interpolate
 
 
 def main():
     FPS = 25
+    # playback speed, frames are dropped to hold the schedule when rendering is slower
+    SPEED = 1.0
+    # True: render at RENDER_FPS blending consecutive poses (smooth slow motion)
+    INTERPOLATE = False
+    RENDER_FPS = 60
 
     wrapper = Open3DWrapper()
     wrapper.initialize_visualizer()
@@ -39,43 +46,35 @@ def main():
 
             for poses_data, rgb_data in chico:
                 subj, act, all_person_kpts, all_robot_kpts = poses_data
+                all_person_kpts = np.asarray(all_person_kpts)
+                all_robot_kpts = np.asarray(all_robot_kpts)
 
-                skeleton, robot = None, None
-                for i, person_kpts in enumerate(all_person_kpts):
-                    robot_kpts = all_robot_kpts[i]
+                scene = Open3DScene(
+                    wrapper, links, robot_links=kuka_links, radius=20
+                )
+                playback = Playback(
+                    Timeline.from_fps(len(all_person_kpts), FPS),
+                    speed=SPEED,
+                    fps=RENDER_FPS,
+                    interpolate=INTERPOLATE,
+                )
+                for frame in playback:
+                    person_kpts = interpolate(all_person_kpts, frame)
+                    robot_kpts = interpolate(all_robot_kpts, frame)
 
-                    # Create / Update person skeleton
-                    if skeleton is None:
-                        skeleton = wrapper.create_skeleton(person_kpts, links, radius=20)
-                    else:
-                        skeleton.update(person_kpts)
-
-                    # Create / Update robot skeleton
-                    if robot is None:
-                        robot = wrapper.create_skeleton(
-                            robot_kpts,
-                            kuka_links,
-                            radius=20,
-                            line_colors=[[0, 0, 1]] * 9,
-                            point_colors=[[0, 0, 1]] * 9,
-                        )
-                    else:
-                        robot.update(robot_kpts)
+                    # Update person and robot skeletons, [1,15,3] and [9,3]
+                    scene.update(person_kpts[None], robot_kpts)
 
                     # Add coordinate system
                     if coordinate_system is None:
-                        pts = np.asarray(person_kpts)
-                        loc = [
-                            np.min(pts[:, 0]).item(),
-                            np.min(pts[:, 1]).item(),
-                            np.min(pts[:, 2]).item(),
-                        ]
+                        loc = person_kpts.min(axis=0).tolist()
                         coordinate_system = wrapper.create_coordinate_system(loc, 150)
 
                     wrapper.update()
-                    wrapper.wait(1 / FPS)
 
+                print(f"{subj} {act}: {playback.stats}")
                 wrapper.clear()
+                scene.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,262 @@
+import asyncio
+import collections
+import time
+from typing import Any, Callable, Deque, Dict, Optional
+import numpy as np
+import redis
+import redis.asyncio
+from profiling.profiler import PROFILER, timer
+from streaming.pose_stream import PoseFrame, decode_frame, encode_frame, record_received
+
+
+# what a full queue does with a new message
+DROP_OLDEST = "drop_oldest"  # conflate: keep the newest maxlen messages
+DROP_NEWEST = "drop_newest"  # keep the oldest maxlen messages
+BLOCK = "block"  # wait for the consumer, stalls the dispatch of every channel of the bus
+
+
+class QueueClosed(Exception):
+    """The channel of a ConflatingQueue was unsubscribed or its bus closed"""
+
+
+class ConflatingQueue:
+    """asyncio queue holding at most maxlen messages
+
+    With maxlen=1 and DROP_OLDEST (the default) get() always returns the
+    newest message: a slow consumer skips frames instead of lagging behind.
+    Messages discarded by the policy are counted in dropped. Once the
+    producer fail()s, get() raises its error after the queued messages;
+    after close() it raises QueueClosed and async iteration stops.
+    """
+
+    def __init__(self, maxlen: int = 1, policy: str = DROP_OLDEST) -> None:
+        assert maxlen > 0, "Expected a positive maxlen"
+        assert policy in (DROP_OLDEST, DROP_NEWEST, BLOCK), f"Unknown policy {policy}"
+        self.maxlen = maxlen
+        self.policy = policy
+        self.items: Deque[Any] = collections.deque()
+        self.received = 0
+        self.dropped = 0
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        self.error: Optional[BaseException] = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def put_nowait(self, item: Any) -> bool:
+        """Add a message applying the policy, False if it was dropped"""
+        self.received += 1
+        if len(self.items) >= self.maxlen:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.policy == BLOCK:
+                raise asyncio.QueueFull()
+            self.items.popleft()
+            self.dropped += 1
+
+        self.items.append(item)
+        self.not_empty.set()
+        if len(self.items) >= self.maxlen:
+            self.not_full.clear()
+        return True
+
+    async def put(self, item: Any) -> bool:
+        while self.error is None and self.policy == BLOCK and len(self.items) >= self.maxlen:
+            await self.not_full.wait()
+        if self.error is not None:
+            # nobody is going to read it
+            return False
+        return self.put_nowait(item)
+
+    def get_nowait(self) -> Any:
+        if not self.items:
+            raise asyncio.QueueEmpty()
+        item = self.items.popleft()
+        if not self.items:
+            self.not_empty.clear()
+        self.not_full.set()
+        return item
+
+    async def get(self) -> Any:
+        while not self.items:
+            if self.error is not None:
+                raise self.error
+            await self.not_empty.wait()
+        return self.get_nowait()
+
+    def fail(self, error: BaseException) -> None:
+        """No more messages will come: wake up the consumers with error"""
+        self.error = error
+        self.not_empty.set()
+        self.not_full.set()
+
+    def close(self) -> None:
+        """No more messages will come: consumers stop once the queued ones are read"""
+        if self.error is None:
+            self.fail(QueueClosed())
+
+    def __aiter__(self) -> "ConflatingQueue":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            return await self.get()
+        except QueueClosed:
+            raise StopAsyncIteration
+
+
+class PoseBus:
+    """asyncio client of the pose bus, many channels on one connection and one event loop
+
+    Every subscribed channel (e.g. cell1:person, cell1:robot, cell1:forecast)
+    gets its own ConflatingQueue; a single reader task receives the messages
+    of all the channels and dispatches them. Frames are decoded with
+    decode_frame, raw bytes are queued with raw=True.
+
+    Connection errors are retried (redis-py reconnects and resubscribes) for
+    up to reconnect_timeout seconds; then, or on any other reader error, every
+    queue raises the error from get() once its messages are consumed.
+
+        async with PoseBus("redis://127.0.0.1:6379/0") as bus:
+            person = await bus.subscribe("cell1:person")
+            forecasts = await bus.subscribe("cell1:forecast", maxlen=10)
+            frame = await person.get()
+            await bus.publish("cell1:forecast", prediction)
+    """
+
+    def __init__(self, client=None, reconnect_timeout: float = 10.0) -> None:
+        if client is None or isinstance(client, str):
+            client = redis.asyncio.Redis.from_url(client or "redis://127.0.0.1:6379/0")
+        self.redis: redis.asyncio.Redis = client
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.queues: Dict[str, ConflatingQueue] = {}
+        self.decoders: Dict[str, Callable[[bytes], Any]] = {}
+        self.seq: Dict[str, int] = collections.defaultdict(int)
+        self.reader: Optional[asyncio.Task] = None
+        self.reconnect_timeout = reconnect_timeout
+        self.errors = 0
+        self.error: Optional[BaseException] = None
+        self.stopped = False
+
+    async def __aenter__(self) -> "PoseBus":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def subscribe(
+        self,
+        channel: str,
+        maxlen: int = 1,
+        policy: str = DROP_OLDEST,
+        raw: bool = False,
+    ) -> ConflatingQueue:
+        """Queue receiving the messages of a channel from now on
+
+        Args:
+            channel (str): channel name
+            maxlen (int, optional): messages kept for a slow consumer, 1 keeps only the newest. Defaults to 1.
+            policy (str, optional): DROP_OLDEST, DROP_NEWEST or BLOCK, applied when the queue is full. Defaults to DROP_OLDEST.
+            raw (bool, optional): queue the payload bytes instead of the decoded PoseFrame. Defaults to False.
+        """
+        if self.error is not None:
+            raise self.error
+        if channel in self.queues:
+            return self.queues[channel]
+
+        queue = ConflatingQueue(maxlen, policy)
+        self.queues[channel] = queue
+        self.decoders[channel] = (lambda b: b) if raw else decode_frame
+        await self.pubsub.subscribe(channel)
+
+        if self.reader is None:
+            self.reader = asyncio.ensure_future(self._read())
+        return queue
+
+    async def unsubscribe(self, channel: str) -> None:
+        await self.pubsub.unsubscribe(channel)
+        queue = self.queues.pop(channel, None)
+        self.decoders.pop(channel, None)
+        if queue is not None:
+            # consumers still waiting on it would wait forever
+            queue.close()
+
+    async def _read(self) -> None:
+        try:
+            await self._dispatch()
+        except Exception as e:
+            # consumers waiting on get() would otherwise wait forever
+            self.error = e
+            for queue in self.queues.values():
+                queue.fail(e)
+
+    async def _dispatch(self) -> None:
+        failing_since: Optional[float] = None
+        while not self.stopped:
+            try:
+                # blocks until a message of any channel arrives, the timeout only bounds
+                # the time to notice close() (cancelling a pending read is not reliable)
+                msg = await self.pubsub.get_message(timeout=1.0)
+            except (redis.ConnectionError, redis.TimeoutError):
+                now = time.time()
+                failing_since = failing_since or now
+                if now - failing_since > self.reconnect_timeout:
+                    raise
+                # the next get_message reconnects
+                await asyncio.sleep(min(1.0, now - failing_since + 0.1))
+                continue
+            failing_since = None
+
+            if msg is None or msg["type"] != "message":
+                continue
+
+            channel = msg["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            queue = self.queues.get(channel)
+            if queue is None:
+                continue
+            try:
+                item = self.decoders[channel](msg["data"])
+            except ValueError as e:
+                # a foreign message must not stop the other channels
+                self.errors += 1
+                PROFILER.count("stream.decode_errors")
+                print(f"Discarding a message of {channel}: {e}")
+                continue
+            if isinstance(item, PoseFrame):
+                record_received(item)
+            await queue.put(item)
+
+    async def publish(
+        self,
+        channel: str,
+        people: np.ndarray,
+        robot: Optional[np.ndarray] = None,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """Publish a pose frame with the next sequence number of the channel"""
+        seq = self.seq[channel]
+        self.seq[channel] += 1
+        payload = encode_frame(
+            seq, time.time() if timestamp is None else timestamp, people, robot
+        )
+        with timer("stream.publish"):
+            await self.redis.publish(channel, payload)
+        return seq
+
+    async def close(self) -> None:
+        self.stopped = True
+        if self.reader is not None:
+            done, _ = await asyncio.wait([self.reader], timeout=2.0)
+            if not done:
+                # blocked on a full BLOCK queue
+                self.reader.cancel()
+            self.reader = None
+        for queue in self.queues.values():
+            queue.close()
+        await self.pubsub.aclose()
+        await self.redis.aclose()
@@ -0,0 +1,291 @@
+import struct
+import threading
+import time
+from typing import NamedTuple, Optional, Union
+import numpy as np
+import redis
+from profiling.profiler import PROFILER, timed, timer
+
+
+# magic, version, seq, timestamp (s), people P, person joints J, robot joints R
+FRAME_HEADER = struct.Struct("<2sBxQdHHH")
+FRAME_MAGIC = b"PF"
+FRAME_VERSION = 1
+
+
+class PoseFrame(NamedTuple):
+    seq: int
+    timestamp: float
+    # float32 [P,J,3], NaN for missing joints
+    people: np.ndarray
+    # float32 [R,3], empty when there is no robot
+    robot: np.ndarray
+
+
+def encode_frame(
+    seq: int,
+    timestamp: float,
+    people: np.ndarray,
+    robot: Optional[np.ndarray] = None,
+) -> bytes:
+    """Binary frame: FRAME_HEADER followed by the float32 people and robot keypoints"""
+    people = np.ascontiguousarray(people, dtype="<f4")
+    if people.ndim == 2:
+        people = people[None]
+    if people.size == 0:
+        people = people.reshape(0, people.shape[1] if people.ndim == 3 else 0, 3)
+    robot = np.ascontiguousarray(robot if robot is not None else np.zeros((0, 3)), dtype="<f4")
+    robot = robot.reshape(-1, 3)
+
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, seq, timestamp, people.shape[0], people.shape[1], len(robot)
+    )
+    return b"".join((header, people.data, robot.data))
+
+
+@timed("stream.decode")
+def decode_frame(payload: bytes) -> PoseFrame:
+    """Inverse of encode_frame, the arrays are read only views of the payload"""
+    if len(payload) < FRAME_HEADER.size:
+        raise ValueError(f"Not a pose frame ({len(payload)} bytes)")
+    magic, version, seq, timestamp, p, j, r = FRAME_HEADER.unpack_from(payload)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"Not a pose frame (magic {magic!r}, version {version})")
+
+    offset = FRAME_HEADER.size
+    if len(payload) != offset + (p * j + r) * 3 * 4:
+        raise ValueError(f"Truncated pose frame ({len(payload)} bytes)")
+    people = np.frombuffer(payload, dtype="<f4", count=p * j * 3, offset=offset)
+    robot = np.frombuffer(payload, dtype="<f4", count=r * 3, offset=offset + people.nbytes)
+    return PoseFrame(seq, timestamp, people.reshape(p, j, 3), robot.reshape(r, 3))
+
+
+def record_received(frame: PoseFrame) -> PoseFrame:
+    """Profile the publish to receive latency of a frame (the clocks of the hosts must agree)"""
+    if PROFILER.enabled:
+        PROFILER.record("stream.latency", time.time() - frame.timestamp)
+        PROFILER.count("stream.received")
+    return frame
+
+
+def decode_or_discard(payload: bytes, channel: str) -> Optional[PoseFrame]:
+    """decode_frame, or None (logged and profiled) for a message that is not a pose frame"""
+    try:
+        return decode_frame(payload)
+    except ValueError as e:
+        # a foreign message must not stop the subscriber
+        PROFILER.count("stream.decode_errors")
+        print(f"Discarding a message of {channel}: {e}")
+        return None
+
+
+def _connect(client: Union[str, redis.Redis, None]) -> redis.Redis:
+    if isinstance(client, redis.Redis):
+        return client
+    # binary payloads: responses must not be decoded
+    return redis.Redis.from_url(client or "redis://127.0.0.1:6379/0")
+
+
+class PosePublisher:
+    """Publish pose frames on a Redis channel
+
+    Every frame gets the next sequence number. With keep_latest the frame is
+    also stored in the <channel>:latest key (in the same round trip), so a
+    subscriber joining late starts from the current pose.
+    """
+
+    def __init__(
+        self,
+        channel: str = "poses",
+        client: Union[str, redis.Redis, None] = None,
+        keep_latest: bool = True,
+    ) -> None:
+        self.channel = channel
+        self.redis = _connect(client)
+        self.keep_latest = keep_latest
+        self.seq = 0
+
+    def publish(
+        self,
+        people: np.ndarray,
+        robot: Optional[np.ndarray] = None,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """Publish a frame, returns its sequence number"""
+        seq = self.seq
+        self.seq += 1
+        payload = encode_frame(
+            seq, time.time() if timestamp is None else timestamp, people, robot
+        )
+
+        with timer("stream.publish"):
+            if self.keep_latest:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.set(f"{self.channel}:latest", payload)
+                pipe.publish(self.channel, payload)
+                pipe.execute()
+            else:
+                self.redis.publish(self.channel, payload)
+        return seq
+
+
+class PoseSubscriber:
+    """Follow the newest pose frame of a Redis channel
+
+    A background thread blocks on the subscription socket and keeps only the
+    newest frame; latest() returns it as soon as it arrives, without polling.
+    Frames replaced before being read are counted in skipped, messages that
+    are not pose frames are discarded and counted in errors.
+
+    A lost connection is retried (redis-py resubscribes on reconnect) for up
+    to reconnect_timeout seconds, then latest() raises the connection error.
+    """
+
+    def __init__(
+        self,
+        channel: str = "poses",
+        client: Union[str, redis.Redis, None] = None,
+        reconnect_timeout: float = 10.0,
+    ) -> None:
+        self.channel = channel
+        self.redis = _connect(client)
+        self.reconnect_timeout = reconnect_timeout
+
+        self.frame: Optional[PoseFrame] = None
+        self.last_read = -1
+        self.received = 0
+        self.skipped = 0
+        self.errors = 0
+        # connection error that stopped the background thread
+        self.error: Optional[Exception] = None
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+        latest = self.redis.get(f"{channel}:latest")
+        if latest is not None:
+            frame = decode_or_discard(latest, f"{channel}:latest")
+            if frame is None:
+                self.errors += 1
+            else:
+                self._put(frame)
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self) -> "PoseSubscriber":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _put(self, frame: PoseFrame) -> None:
+        with self.condition:
+            if self.frame is not None and frame.seq == self.frame.seq:
+                # the frame read from <channel>:latest is also published
+                return
+            if self.frame is not None and frame.seq < self.frame.seq:
+                # the publisher restarted
+                self.last_read = -1
+            elif self.frame is not None and self.frame.seq > self.last_read:
+                self.skipped += 1
+                PROFILER.count("stream.skipped")
+            self.frame = frame
+            self.received += 1
+            self.condition.notify_all()
+
+    def _run(self) -> None:
+        failing_since: Optional[float] = None
+        while not self.stopped.is_set():
+            try:
+                # blocks on the socket, the timeout only bounds the time to notice close()
+                msg = self.pubsub.get_message(timeout=1.0)
+            except (redis.ConnectionError, redis.TimeoutError) as e:
+                now = time.time()
+                failing_since = failing_since or now
+                if now - failing_since > self.reconnect_timeout:
+                    with self.condition:
+                        self.error = e
+                        self.condition.notify_all()
+                    return
+                # the next get_message reconnects
+                self.stopped.wait(min(1.0, now - failing_since + 0.1))
+                continue
+            failing_since = None
+
+            if msg is None or msg["type"] != "message":
+                continue
+            frame = decode_or_discard(msg["data"], self.channel)
+            if frame is None:
+                self.errors += 1
+                continue
+            self._put(record_received(frame))
+
+    def latest(self, timeout: Optional[float] = None) -> Optional[PoseFrame]:
+        """Newest frame not returned yet, waits for it up to timeout seconds (None: forever)
+
+        Raises the connection error once reconnecting failed for reconnect_timeout seconds.
+        """
+        with self.condition:
+            ready = self.condition.wait_for(
+                lambda: self.error is not None
+                or (self.frame is not None and self.frame.seq != self.last_read),
+                timeout,
+            )
+            if not ready:
+                return None
+            if self.frame is None or self.frame.seq == self.last_read:
+                raise self.error
+            self.last_read = self.frame.seq
+            return self.frame
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.pubsub.close()
+
+
+class AsyncPoseSubscriber:
+    """asyncio subscriber (redis.asyncio), frames are yielded in arrival order
+
+    Messages that are not pose frames are discarded and counted in errors.
+    """
+
+    def __init__(self, channel: str = "poses", client=None) -> None:
+        import redis.asyncio
+
+        self.channel = channel
+        if client is None or isinstance(client, str):
+            client = redis.asyncio.Redis.from_url(client or "redis://127.0.0.1:6379/0")
+        self.redis: redis.asyncio.Redis = client
+        self.pubsub = None
+        self.errors = 0
+
+    async def __aenter__(self) -> "AsyncPoseSubscriber":
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.channel)
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+
+    async def frames(self):
+        """Async iterator over the frames, in order, as they arrive"""
+        latest = await self.redis.get(f"{self.channel}:latest")
+        if latest is not None:
+            frame = decode_or_discard(latest, f"{self.channel}:latest")
+            if frame is None:
+                self.errors += 1
+            else:
+                yield frame
+        async for msg in self.pubsub.listen():
+            if msg["type"] != "message":
+                continue
+            frame = decode_or_discard(msg["data"], self.channel)
+            if frame is None:
+                self.errors += 1
+                continue
+            yield record_received(frame)
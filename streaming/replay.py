@@ -0,0 +1,229 @@
+import os
+import time
+import asyncio
+import argparse
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+import redis.asyncio
+from datasets.chico_dataset import CHICODataset
+from datasets.befine.befine_dataset import BeFineDataset
+from profiling.profiler import timer
+from streaming.pose_stream import encode_frame
+from visualizer.playback import Timeline
+
+
+class ReplayStream:
+    """A recording to publish: a channel, a Timeline and the frame getter
+
+    frame(i) returns (people [P,J,3], robot [R,3] or None) of frame i.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        timeline: Timeline,
+        frame: Callable[[int], Tuple[np.ndarray, Optional[np.ndarray]]],
+    ) -> None:
+        self.channel = channel
+        self.timeline = timeline
+        self.frame = frame
+
+    def __len__(self) -> int:
+        return len(self.timeline)
+
+
+class ReplayStats:
+    def __init__(self, channel: str) -> None:
+        self.channel = channel
+        self.frames = 0
+        self.elapsed = 0.0
+        # publish time - scheduled time of every frame, seconds
+        self.lateness: List[float] = []
+
+    @property
+    def rate(self) -> float:
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+
+    def jitter(self) -> Tuple[float, float, float]:
+        """Lateness of the published frames (p50, p99, max), seconds"""
+        if not self.lateness:
+            return 0.0, 0.0, 0.0
+        lateness = np.asarray(self.lateness)
+        return (
+            float(np.percentile(lateness, 50)),
+            float(np.percentile(lateness, 99)),
+            float(lateness.max()),
+        )
+
+    def __repr__(self) -> str:
+        p50, p99, worst = self.jitter()
+        return (
+            f"{self.channel}: {self.frames} frames in {self.elapsed:.1f}s ({self.rate:.1f} frames/s), "
+            f"lateness p50 {p50 * 1000:.2f}ms p99 {p99 * 1000:.2f}ms max {worst * 1000:.2f}ms"
+        )
+
+
+def chico_streams(
+    root: str,
+    subjects: Optional[List[str]] = None,
+    actions: Optional[List[str]] = None,
+    prefix: str = "replay",
+    fps: float = 25,
+) -> List[ReplayStream]:
+    """One stream per CHICO recording, on <prefix>:<subject>:<action>"""
+    chico = CHICODataset(root, columnar=True)
+    streams = []
+    for i in range(len(chico)):
+        subj, act, person, robot = chico.get_poses(i)
+        if subjects and subj not in subjects:
+            continue
+        if actions and act not in actions:
+            continue
+        person, robot = np.asarray(person), np.asarray(robot)
+        streams.append(
+            ReplayStream(
+                f"{prefix}:{subj}:{act}",
+                Timeline.from_fps(len(person), fps),
+                lambda t, person=person, robot=robot: (person[t][None], robot[t]),
+            )
+        )
+    return streams
+
+
+def befine_streams(
+    root: str,
+    subject: Optional[str] = None,
+    action: Optional[str] = None,
+    prefix: str = "replay",
+) -> List[ReplayStream]:
+    """One stream per BeFine action file, on <prefix>:<subject>:<action file>, timed by its timestamps"""
+    befine = BeFineDataset(root, subject, action)
+    streams = []
+    for subj, action_path in befine.recordings:
+        seq = befine.subjects[subj]["actions"][action_path]
+        if len(seq) == 0:
+            continue
+        name = os.path.splitext(os.path.basename(action_path))[0]
+        streams.append(
+            ReplayStream(
+                f"{prefix}:{os.path.basename(subj)}:{name}",
+                # BeFine timestamps are milliseconds
+                Timeline.from_timestamps(seq.timestamps, unit=1e-3),
+                lambda t, seq=seq: (seq.bodies(t), None),
+            )
+        )
+    return streams
+
+
+async def replay(
+    client: redis.asyncio.Redis,
+    stream: ReplayStream,
+    speed: Optional[float] = 1.0,
+    loops: int = 1,
+) -> ReplayStats:
+    """Publish a stream at its original timing divided by speed, as fast as possible with speed=None"""
+    stats = ReplayStats(stream.channel)
+    times = stream.timeline.times
+    seq = 0
+    start = time.perf_counter()
+    for loop in range(loops):
+        loop_start = time.perf_counter()
+        for i in range(len(stream)):
+            if speed is not None:
+                scheduled = loop_start + times[i] / speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # let the other streams run
+                scheduled = time.perf_counter()
+                await asyncio.sleep(0)
+
+            people, robot = stream.frame(i)
+            with timer("stream.publish"):
+                await client.publish(
+                    stream.channel, encode_frame(seq, time.time(), people, robot)
+                )
+            stats.lateness.append(time.perf_counter() - scheduled)
+            stats.frames += 1
+            seq += 1
+
+        if speed is not None and loop + 1 < loops:
+            # keep the frame period between the last frame and the restart
+            period = times[-1] / max(len(times) - 1, 1)
+            await asyncio.sleep(period / speed)
+
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+async def replay_all(
+    streams: List[ReplayStream],
+    client=None,
+    speed: Optional[float] = 1.0,
+    loops: int = 1,
+) -> List[ReplayStats]:
+    """Replay every stream concurrently on one event loop and one connection pool
+
+    client is a redis.asyncio.Redis or its URL.
+    """
+    owned = client is None or isinstance(client, str)
+    if owned:
+        client = redis.asyncio.Redis.from_url(client or "redis://127.0.0.1:6379/0")
+    try:
+        return await asyncio.gather(*[replay(client, s, speed, loops) for s in streams])
+    finally:
+        if owned:
+            await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Publish recorded CHICO or BeFine sequences on Redis channels, as a live feed"
+    )
+    parser.add_argument("--dataset", choices=["chico", "befine"], default="chico")
+    parser.add_argument("--root", default=None, help="defaults to data/chico or data/godot")
+    parser.add_argument("--url", default="redis://127.0.0.1:6379/0")
+    parser.add_argument("--prefix", default="replay", help="channels are <prefix>:<subject>:<action>")
+    parser.add_argument("--speed", type=float, default=1.0, help="0: as fast as possible")
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument("--copies", type=int, default=1, help="publish every recording on this many channels, for load tests")
+    parser.add_argument("--subjects", nargs="*", default=None)
+    parser.add_argument("--actions", nargs="*", default=None)
+    args = parser.parse_args()
+
+    root = args.root or ("data/chico" if args.dataset == "chico" else "data/godot")
+    if args.dataset == "chico":
+        streams = chico_streams(root, args.subjects, args.actions, args.prefix)
+    else:
+        streams = []
+        for subj in args.subjects or [None]:
+            for act in args.actions or [None]:
+                streams += befine_streams(root, subj, act, args.prefix)
+
+    if args.copies > 1:
+        streams = [
+            ReplayStream(f"{s.channel}:{c}", s.timeline, s.frame)
+            for s in streams
+            for c in range(args.copies)
+        ]
+
+    speed = args.speed if args.speed > 0 else None
+    print(f"Replaying {len(streams)} streams at {'max' if speed is None else speed}x speed")
+
+    start = time.time()
+    results = asyncio.run(replay_all(streams, args.url, speed, args.loops))
+    elapsed = time.time() - start
+
+    for stats in results:
+        print(stats)
+    total = sum(s.frames for s in results)
+    lateness = np.concatenate([s.lateness for s in results if s.lateness] or [np.zeros(1)])
+    print(
+        f"Done: {total} frames in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} frames/s overall), "
+        f"lateness p50 {np.percentile(lateness, 50) * 1000:.2f}ms p99 {np.percentile(lateness, 99) * 1000:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
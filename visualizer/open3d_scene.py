@@ -0,0 +1,201 @@
+from typing import Dict, Hashable, List, Optional, Sequence
+import numpy as np
+import open3d as o3d
+from profiling.profiler import timed
+from visualizer.open3d_wrapper import Open3DWrapper
+
+
+# colors of the people, by skeleton slot
+PEOPLE_COLORS = [
+    [0.49, 0.49, 0.49],
+    [0.85, 0.37, 0.01],
+    [0.11, 0.62, 0.47],
+    [0.46, 0.44, 0.70],
+    [0.91, 0.16, 0.54],
+    [0.40, 0.65, 0.12],
+    [0.90, 0.67, 0.01],
+    [0.65, 0.46, 0.11],
+]
+ROBOT_COLOR = [0.0, 0.0, 1.0]
+
+
+class Open3DArraySkeleton:
+    """Skeleton drawn from a [J,3] array, with NaN joints hidden
+
+    Joint spheres are merged in one TriangleMesh (see Open3DMergedSkeleton).
+    Bones use a per-segment LineSet layout: bone i owns points 2i and 2i+1,
+    so the line indices never change and a bone is hidden by collapsing its
+    two points. A NaN joint is hidden by collapsing its sphere to a point.
+    Everything is written in place in the Open3D buffers, no geometry is
+    rebuilt while the visible joints change.
+    """
+
+    def __init__(
+        self,
+        wrapper: Open3DWrapper,
+        n_joints: int,
+        links: Optional[Sequence[Sequence[int]]],
+        color: Sequence[float],
+        radius: float,
+        resolution: int = 10,
+    ) -> None:
+        self.wrapper = wrapper
+        self.n_joints = n_joints
+        self.links = np.asarray(
+            links if links is not None else [], dtype=np.int64
+        ).reshape(-1, 2)
+        self.color = color
+        # hidden geometry is collapsed here, to not stretch the scene bounding box
+        self.anchor = np.zeros(3)
+
+        locations = np.zeros((n_joints, 3))
+        self.mesh, self.template = wrapper.create_merged_points(
+            locations, [color] * n_joints, radius, resolution
+        )
+
+        self.lines = o3d.geometry.LineSet(
+            points=o3d.utility.Vector3dVector(np.zeros((2 * len(self.links), 3))),
+            lines=o3d.utility.Vector2iVector(
+                np.arange(2 * len(self.links)).reshape(-1, 2)
+            ),
+        )
+        self.lines.colors = o3d.utility.Vector3dVector(
+            np.tile(np.asarray(color, dtype=np.float64), (len(self.links), 1))
+        )
+        wrapper.add_geometry(self.lines)
+
+        self.visible = True
+        self.hide()
+
+    @timed("render.skeleton_update")
+    def update(self, locations: np.ndarray) -> None:
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        valid = np.isfinite(locations).all(axis=1)
+        if valid.any():
+            self.anchor = locations[valid].mean(axis=0)
+        locations = np.where(valid[:, None], locations, self.anchor)
+
+        # [J,1,3] + [1,V,3] * {0,1}: hidden spheres shrink to their center
+        vertices = np.asarray(self.mesh.vertices).reshape(
+            len(locations), len(self.template), 3
+        )
+        np.multiply(self.template[None, :, :], valid[:, None, None], out=vertices)
+        vertices += locations[:, None, :]
+
+        # [L,2,3], bones with a hidden end collapse on their first end
+        segments = np.asarray(self.lines.points).reshape(-1, 2, 3)
+        segments[:] = locations[self.links]
+        hidden = ~valid[self.links].all(axis=1)
+        segments[hidden, 1] = segments[hidden, 0]
+
+        self.visible = bool(valid.any())
+        self.wrapper.mark_dirty([self.mesh, self.lines])
+
+    def hide(self) -> None:
+        self.update(np.full((self.n_joints, 3), np.nan))
+
+
+class Open3DScene:
+    """Whole frame update of all the skeletons of a scene
+
+    update() takes all the people of a frame [P,J,3] (and optionally the robot
+    [R,3]) as arrays and updates every skeleton in one call. Skeletons are
+    pooled: they are created the first time a frame holds that many people and
+    hidden, not removed, when the people leave. With ids (e.g. BeFine body_id)
+    every body keeps its skeleton, and its color, while it is tracked.
+    """
+
+    def __init__(
+        self,
+        wrapper: Open3DWrapper,
+        links: Sequence[Sequence[int]],
+        robot_links: Optional[Sequence[Sequence[int]]] = None,
+        radius: float = 0.5,
+        robot_radius: Optional[float] = None,
+        colors: Optional[List[List[float]]] = None,
+        robot_color: Optional[List[float]] = None,
+    ) -> None:
+        self.wrapper = wrapper
+        self.links = links
+        self.robot_links = robot_links
+        self.radius = radius
+        self.robot_radius = robot_radius if robot_radius is not None else radius
+        self.colors = colors if colors is not None else PEOPLE_COLORS
+        self.robot_color = robot_color if robot_color is not None else ROBOT_COLOR
+
+        self.skeletons: List[Open3DArraySkeleton] = []
+        self.robot: Optional[Open3DArraySkeleton] = None
+        # tracked id -> skeleton slot
+        self.slots: Dict[Hashable, int] = {}
+
+    def _skeleton(self, slot: int, n_joints: int) -> Open3DArraySkeleton:
+        while len(self.skeletons) <= slot:
+            color = self.colors[len(self.skeletons) % len(self.colors)]
+            self.skeletons.append(
+                Open3DArraySkeleton(
+                    self.wrapper, n_joints, self.links, color, self.radius
+                )
+            )
+        return self.skeletons[slot]
+
+    def _assign(self, ids: Sequence[Hashable]) -> List[int]:
+        current = set(ids)
+        self.slots = {k: s for k, s in self.slots.items() if k in current}
+        used = set(self.slots.values())
+        free = (s for s in range(len(self.skeletons) + len(ids)) if s not in used)
+
+        res = []
+        for k in ids:
+            if k not in self.slots:
+                self.slots[k] = next(free)
+            res.append(self.slots[k])
+        return res
+
+    @timed("render.scene_update")
+    def update(
+        self,
+        people: np.ndarray,
+        robot: Optional[np.ndarray] = None,
+        ids: Optional[Sequence[Hashable]] = None,
+    ) -> None:
+        """Update the scene to a new frame
+
+        Args:
+            people (np.ndarray): keypoints of all the people [P,J,3], NaN for missing joints
+            robot (Optional[np.ndarray], optional): robot keypoints [R,3]. Defaults to None.
+            ids (Optional[Sequence[Hashable]], optional): tracking id of every person [P], slots are the indices when missing. Defaults to None.
+        """
+        people = np.asarray(people, dtype=np.float64)
+        if people.ndim == 2:
+            people = people[None]
+        if ids is not None:
+            assert len(ids) == len(people), "Expected one id per person"
+            slots = self._assign(ids)
+        else:
+            slots = list(range(len(people)))
+
+        for slot, kpts in zip(slots, people):
+            self._skeleton(slot, kpts.shape[0]).update(kpts)
+
+        shown = set(slots)
+        for slot, skeleton in enumerate(self.skeletons):
+            if slot not in shown and skeleton.visible:
+                skeleton.hide()
+
+        if robot is not None:
+            robot = np.asarray(robot, dtype=np.float64).reshape(-1, 3)
+            if self.robot is None:
+                self.robot = Open3DArraySkeleton(
+                    self.wrapper,
+                    len(robot),
+                    self.robot_links,
+                    self.robot_color,
+                    self.robot_radius,
+                )
+            self.robot.update(robot)
+
+    def clear(self) -> None:
+        """Forget the pooled skeletons, call it after Open3DWrapper.clear()"""
+        self.skeletons.clear()
+        self.robot = None
+        self.slots.clear()
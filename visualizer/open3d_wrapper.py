@@ -1,9 +1,10 @@
 import os
 import time
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 import open3d as o3d
 import numpy as np
 from trimesh import PointCloud
+from profiling.profiler import timed, timer
 
 
 class Open3DSkeleton:
@@ -12,14 +13,18 @@ class Open3DSkeleton:
         points: List[o3d.geometry.TriangleMesh],
         lines: Optional[o3d.geometry.LineSet] = None,
         links: List[List[int]] = None,
+        wrapper: Optional["Open3DWrapper"] = None,
     ) -> None:
         self.points = points
         self.lines = lines
+        # notified of the changed geometries on update()
+        self.wrapper = wrapper
 
         if lines is not None:
             assert links is not None, "If lines is provided, include also the links "
         self.links = links
 
+    @timed("render.skeleton_update")
     def update(
         self,
         points_locations: List[List[int]],
@@ -52,14 +57,138 @@ class Open3DSkeleton:
             if new_colors is not None:
                 self.lines.colors = o3d.utility.Vector3dVector(new_colors)
 
+        if self.wrapper is not None:
+            self.wrapper.mark_dirty(self.points)
+            if self.lines is not None:
+                self.wrapper.mark_dirty(self.lines)
+
+
+class Open3DMergedSkeleton:
+    """Skeleton whose joint spheres are merged in a single TriangleMesh
+
+    The mesh vertices are rebuilt from a template sphere (centered in the
+    origin, [V,3]) and the joint locations ([J,3]) with one vectorized numpy
+    operation, so a frame costs a single geometry upload instead of one per
+    joint. Same update() interface of Open3DSkeleton.
+    """
+
+    def __init__(
+        self,
+        mesh: o3d.geometry.TriangleMesh,
+        template: np.ndarray,
+        locations: np.ndarray,
+        lines: Optional[o3d.geometry.LineSet] = None,
+        links: List[List[int]] = None,
+        wrapper: Optional["Open3DWrapper"] = None,
+    ) -> None:
+        self.mesh = mesh
+        self.template = template
+        self.locations = locations
+        self.lines = lines
+        self.wrapper = wrapper
+
+        if lines is not None:
+            assert links is not None, "If lines is provided, include also the links "
+        self.links = links
+
+    @timed("render.skeleton_update")
+    def update(
+        self,
+        points_locations: List[List[int]],
+        relative: bool = False,
+        new_colors: List[List[int]] = None,
+    ) -> None:
+        locations = np.asarray(points_locations, dtype=np.float64).reshape(-1, 3)
+        assert len(locations) == len(
+            self.locations
+        ), "Expected the new locations to have the same number of elements of self.locations!"
+
+        if relative:
+            locations = self.locations + locations
+        self.locations = locations
+
+        # [J,1,3] + [1,V,3], written in place in the mesh vertices buffer
+        vertices = np.asarray(self.mesh.vertices).reshape(
+            len(locations), len(self.template), 3
+        )
+        np.add(locations[:, None, :], self.template[None, :, :], out=vertices)
+
+        if new_colors is not None:
+            assert len(new_colors) == len(
+                self.locations
+            ), "Expected the new colors to have the same number of elements of self.locations!"
+            self.mesh.vertex_colors = o3d.utility.Vector3dVector(
+                np.repeat(np.asarray(new_colors, dtype=np.float64), len(self.template), axis=0)
+            )
+
+        if self.lines is not None:
+            self.lines.points = o3d.utility.Vector3dVector(locations)
+
+            if new_colors is not None:
+                self.lines.colors = o3d.utility.Vector3dVector(new_colors)
+
+        if self.wrapper is not None:
+            self.wrapper.mark_dirty(self.mesh)
+            if self.lines is not None:
+                self.wrapper.mark_dirty(self.lines)
+
 
 class Open3DWrapper:
-    def __init__(self) -> None:
+    # window events are polled at this rate while waiting
+    EVENTS_INTERVAL = 1 / 60
+
+    def __init__(
+        self,
+        offscreen: bool = False,
+        width: int = 1848,
+        height: int = 1136,
+        max_fps: Optional[float] = None,
+    ) -> None:
+        """Open3D visualization helper
+
+        Only the geometries marked as changed (mark_dirty(), done by the
+        skeletons update()) are uploaded again by update().
+
+        Args:
+            offscreen (bool, optional): render without a window (no X server, no event polling) into numpy images, for headless export jobs. Defaults to False.
+            width (int, optional): offscreen image width, the default matches camera_config.json. Defaults to 1848.
+            height (int, optional): offscreen image height. Defaults to 1136.
+            max_fps (Optional[float], optional): cap of the frame rate, update() sleeps to hold it (window and offscreen). Defaults to None.
+        """
         self.vis: o3d.visualization.Visualizer = None
 
+        self.offscreen = offscreen
+        self.width = width
+        self.height = height
+        self.renderer: o3d.visualization.rendering.OffscreenRenderer = None
+        self.camera_set = False
+        # offscreen scene names and materials, by id of the geometry
+        self.names: Dict[int, str] = {}
+        self.materials: Dict[int, o3d.visualization.rendering.MaterialRecord] = {}
+
+        self.max_fps = max_fps
+        self.last_frame_time = 0.0
+
         self.geometries = []
+        # geometries changed since the last update(), by id
+        self.dirty: Dict[int, Any] = {}
+
+    def initialize_visualizer(
+        self,
+    ) -> Union[o3d.visualization.Visualizer, o3d.visualization.rendering.OffscreenRenderer]:
+        if self.offscreen:
+            renderer = o3d.visualization.rendering.OffscreenRenderer(
+                self.width, self.height
+            )
+            # same look of the default Visualizer window
+            renderer.scene.set_background([1.0, 1.0, 1.0, 1.0])
+            renderer.scene.set_lighting(
+                o3d.visualization.rendering.Open3DScene.LightingProfile.NO_SHADOWS,
+                (0.577, -0.577, -0.577),
+            )
+            self.renderer = renderer
+            return renderer
 
-    def initialize_visualizer(self) -> o3d.visualization.Visualizer:
         vis = o3d.visualization.Visualizer()
         vis.create_window()
         self.vis = vis
@@ -67,56 +196,146 @@ class Open3DWrapper:
         return vis
 
     def set_camera_visualization(self) -> None:
-        if self.vis is None:
+        if self.vis is None and self.renderer is None:
             return
 
         if not os.path.isfile("camera_config.json"):
             print("Camera parameters not found!! Press ctrl+p to generate.")
             return
 
-        wc = self.vis.get_view_control()
         # depends on your screen, when running press ctrl+p to generate a new file with visualization info
         camera_parameters = o3d.io.read_pinhole_camera_parameters("camera_config.json")
+
+        if self.renderer is not None:
+            self.renderer.setup_camera(
+                camera_parameters.intrinsic, camera_parameters.extrinsic
+            )
+            self.camera_set = True
+            return
+
+        wc = self.vis.get_view_control()
         wc.convert_from_pinhole_camera_parameters(camera_parameters)
 
         self.vis.poll_events()
         self.vis.update_renderer()
 
+    def _material(self, geometry) -> o3d.visualization.rendering.MaterialRecord:
+        mat = o3d.visualization.rendering.MaterialRecord()
+        if isinstance(geometry, o3d.geometry.LineSet):
+            mat.shader = "unlitLine"
+            mat.line_width = 2.0
+        elif isinstance(geometry, o3d.geometry.TriangleMesh):
+            mat.shader = "defaultLit"
+        else:
+            mat.shader = "defaultUnlit"
+        return mat
+
+    def _add_offscreen(self, geometry) -> None:
+        key = id(geometry)
+        name = f"geometry_{key}"
+        self.names[key] = name
+        self.materials[key] = self._material(geometry)
+        self.renderer.scene.add_geometry(name, geometry, self.materials[key])
+
+    def _update_offscreen(self, geometry) -> None:
+        # legacy geometries cannot be updated in place in the rendering scene
+        key = id(geometry)
+        self.renderer.scene.remove_geometry(self.names[key])
+        self.renderer.scene.add_geometry(self.names[key], geometry, self.materials[key])
+
+    @timed("render.capture")
+    def capture(self) -> np.ndarray:
+        """Render the current frame into an uint8 RGB image [H,W,3]"""
+        if self.renderer is not None:
+            if not self.camera_set:
+                # no camera parameters: frame the whole scene
+                bbox = self.renderer.scene.bounding_box
+                center = bbox.get_center()
+                eye = center + [0.0, 0.0, 2.0 * max(bbox.get_max_extent(), 1e-3)]
+                self.renderer.setup_camera(60.0, center, eye, [0.0, 1.0, 0.0])
+            return np.asarray(self.renderer.render_to_image())
+
+        img = np.asarray(self.vis.capture_screen_float_buffer(do_render=True))
+        return (img * 255).astype(np.uint8)
+
     # def set_camera_transform(self, location, rotation):
     #     ctrl = self.vis.get_view_control()
     #     ctrl.translate(0,0)
 
+    @timed("render.save")
     def save(self, fname):
+        if self.renderer is not None:
+            o3d.io.write_image(fname, o3d.geometry.Image(self.capture()))
+            return
         self.vis.capture_screen_image(fname)
 
-    def update(self) -> None:
-        # Step 1: update geometries transforms
-        for geom in self.geometries:
-            self.vis.update_geometry(geom)
+    def mark_dirty(self, geometry: Union[PointCloud, List[PointCloud]]) -> None:
+        """Schedule the upload of changed geometries on the next update()"""
+        if isinstance(geometry, list):
+            for geom in geometry:
+                self.dirty[id(geom)] = geom
+        else:
+            self.dirty[id(geometry)] = geometry
+
+    def update(self, force: bool = False) -> None:
+        """Upload the changed geometries and render a frame
+
+        Args:
+            force (bool, optional): upload all the geometries, also the ones not marked as dirty. Defaults to False.
+        """
+        changed = self.geometries if force else list(self.dirty.values())
+        self.dirty.clear()
+
+        if self.renderer is not None:
+            # nothing to poll and no window to refresh, images are rendered on capture()
+            with timer("render.update"):
+                for geom in changed:
+                    self._update_offscreen(geom)
+        else:
+            with timer("render.update"):
+                # Step 1: update geometries transforms
+                for geom in changed:
+                    self.vis.update_geometry(geom)
 
-        # Step 2: wait for events
-        self.vis.poll_events()
+                # Step 2: wait for events
+                self.vis.poll_events()
 
-        # Step 3: update renderer view
-        self.vis.update_renderer()
+                # Step 3: update renderer view
+                self.vis.update_renderer()
+
+        # Step 4: hold the frame rate cap, offscreen too (e.g. to throttle an export
+        # sharing the machine)
+        if self.max_fps is not None:
+            remaining = self.last_frame_time + 1 / self.max_fps - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+        self.last_frame_time = time.time()
 
     def wait(self, seconds: int) -> None:
-        # TODO: inspect self.vis.run()
-        start = time.time()
+        if self.renderer is not None:
+            # offscreen there is nobody to show the frames to in real time
+            return
+
+        # sleep, waking up only to keep the window responsive
+        deadline = time.time() + seconds
         while True:
-            if time.time() - start > seconds:
+            self.vis.poll_events()
+            self.vis.update_renderer()
+            remaining = deadline - time.time()
+            if remaining <= 0:
                 break
-            self.update()
+            time.sleep(min(remaining, self.EVENTS_INTERVAL))
 
     def add_geometry(self, geometry: Union[PointCloud, List[PointCloud]]) -> None:
         assert (
-            self.vis is not None
+            self.vis is not None or self.renderer is not None
         ), "Visualizer is required, try to call initialize_visualizer()"
+        add = self._add_offscreen if self.renderer is not None else self.vis.add_geometry
         if isinstance(geometry, list):
-            [self.vis.add_geometry(geom) for geom in geometry]
+            [add(geom) for geom in geometry]
             self.geometries += geometry
         else:
-            self.vis.add_geometry(geometry)
+            add(geometry)
             self.geometries.append(geometry)
 
     def create_box(
@@ -196,6 +415,36 @@ class Open3DWrapper:
             res.append(s)
         return res
 
+    def create_merged_points(
+        self, points, point_colors, radius, resolution: int = 10
+    ) -> Tuple[o3d.geometry.TriangleMesh, np.ndarray]:
+        sphere = o3d.geometry.TriangleMesh.create_sphere(
+            radius=radius, resolution=resolution
+        )
+        sphere.compute_vertex_normals()
+
+        template = np.asarray(sphere.vertices)
+        triangles = np.asarray(sphere.triangles)
+        normals = np.asarray(sphere.vertex_normals)
+        locations = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        n, v = len(locations), len(template)
+
+        mesh = o3d.geometry.TriangleMesh()
+        mesh.vertices = o3d.utility.Vector3dVector(
+            (locations[:, None, :] + template[None, :, :]).reshape(-1, 3)
+        )
+        mesh.triangles = o3d.utility.Vector3iVector(
+            (triangles[None, :, :] + (np.arange(n) * v)[:, None, None]).reshape(-1, 3)
+        )
+        mesh.vertex_normals = o3d.utility.Vector3dVector(np.tile(normals, (n, 1)))
+        mesh.vertex_colors = o3d.utility.Vector3dVector(
+            np.repeat(np.asarray(point_colors, dtype=np.float64), v, axis=0)
+        )
+
+        self.add_geometry(mesh)
+
+        return mesh, template
+
     def create_skeleton(
         self,
         points: List[List[int]],
@@ -203,33 +452,58 @@ class Open3DWrapper:
         line_colors: Optional[List[List[int]]] = None,
         point_colors: Optional[List[List[int]]] = None,
         radius: float = 0.5,
-    ) -> Open3DSkeleton:
+        merge_points: bool = True,
+    ) -> Union[Open3DSkeleton, Open3DMergedSkeleton]:
         if point_colors is None:
             point_colors = [[125 / 255, 125 / 255, 125 / 255]] * len(points)
 
         if line_colors is None:
             line_colors = [[125 / 255, 125 / 255, 125 / 255]] * len(points)
 
+        if merge_points:
+            # one mesh for all the joints: one geometry upload per frame
+            mesh, template = self.create_merged_points(points, point_colors, radius)
+            mesh_lines = self.craete_lines(points, links, line_colors)
+            locations = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+            return Open3DMergedSkeleton(
+                mesh, template, locations, mesh_lines, links, wrapper=self
+            )
+
         # Draw points
         mesh_pts = self.create_points(points, point_colors, radius)
         mesh_lines = self.craete_lines(points, links, line_colors)
 
-        skeleton = Open3DSkeleton(mesh_pts, mesh_lines, links)
+        skeleton = Open3DSkeleton(mesh_pts, mesh_lines, links, wrapper=self)
 
         return skeleton
 
     def clear(self):
-        for geom in self.geometries:
-            self.vis.remove_geometry(geom)
+        if self.renderer is not None:
+            self.renderer.scene.clear_geometry()
+            self.names.clear()
+            self.materials.clear()
+        else:
+            for geom in self.geometries:
+                self.vis.remove_geometry(geom)
 
         self.geometries.clear()
+        self.dirty.clear()
 
     def destroy_window(self):
         if self.vis is not None:
             self.vis.destroy_window()
             self.vis = None
 
+        if self.renderer is not None:
+            self.renderer.scene.clear_geometry()
+            self.renderer = None
+            self.camera_set = False
+            self.names.clear()
+            self.materials.clear()
+
         self.geometries.clear()
+        self.dirty.clear()
 
 
 def __test__():
@@ -274,6 +548,7 @@ def __test__():
             o3d.pipelines.registration.ICPConvergenceCriteria(max_iteration=1),
         )
         source.transform(reg_p2l.transformation)
+        wrapper.mark_dirty(source)
         wrapper.update()
 
     wrapper.destroy_window()
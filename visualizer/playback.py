@@ -0,0 +1,304 @@
+import time
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+
+
+class Timeline:
+    """Presentation time (seconds from the first frame) of every frame of a recording"""
+
+    def __init__(self, times: Sequence[float]) -> None:
+        times = np.asarray(times, dtype=np.float64)
+        assert times.ndim == 1 and len(times) > 0, "Expected the time of at least one frame"
+        assert np.all(np.diff(times) >= 0), "Expected non decreasing frame times"
+        self.times = times - times[0]
+
+    @staticmethod
+    def from_fps(n_frames: int, fps: float) -> "Timeline":
+        return Timeline(np.arange(n_frames) / fps)
+
+    @staticmethod
+    def from_timestamps(timestamps: Sequence[int], unit: float = 1e-3) -> "Timeline":
+        """Timeline of recorded timestamps (e.g. BeFineSequence.timestamps)
+
+        Args:
+            timestamps (Sequence[int]): frame timestamps
+            unit (float, optional): seconds per timestamp tick. Defaults to 1e-3 (milliseconds).
+        """
+        return Timeline(np.asarray(timestamps, dtype=np.float64) * unit)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1])
+
+    def frame_at(self, t: float) -> int:
+        """Last frame shown at time t"""
+        i = int(np.searchsorted(self.times, t, side="right")) - 1
+        return min(max(i, 0), len(self.times) - 1)
+
+
+class PlaybackFrame(NamedTuple):
+    # frame to show, blended with the next one by alpha when interpolating
+    index: int
+    alpha: float
+    time: float
+
+
+class PlaybackStats:
+    def __init__(self) -> None:
+        self.rendered = 0
+        self.dropped = 0
+        self.elapsed = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def fps(self) -> float:
+        return self.rendered / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.rendered} frames in {self.elapsed:.1f}s ({self.fps:.1f} FPS), "
+            f"{self.dropped} dropped, max lag {self.max_lag * 1000:.0f}ms"
+        )
+
+
+class Playback:
+    """Paces the frames of a Timeline
+
+    Iterating yields the PlaybackFrame to render next; the time spent by the
+    caller rendering a frame is accounted for by the schedule.
+
+    - realtime, no interpolation: every frame is shown at its timestamp divided
+      by speed; when rendering falls behind, the late frames are dropped and
+      playback jumps to the frame due now.
+    - realtime, interpolate: frames are rendered at fps, each one blending the
+      two recorded frames around the playback time (see interpolate()).
+    - not realtime: no waiting (offscreen export); with fps the recording is
+      resampled to a constant frame rate (frames repeated or dropped), without
+      fps every frame is yielded once.
+
+    stats holds the achieved frame rate and the dropped frames.
+    """
+
+    def __init__(
+        self,
+        timeline: Timeline,
+        speed: float = 1.0,
+        fps: Optional[float] = None,
+        interpolate: bool = False,
+        realtime: bool = True,
+    ) -> None:
+        assert speed > 0, "Expected a positive speed"
+        assert not interpolate or fps is not None, "Interpolation requires the render fps"
+        self.timeline = timeline
+        self.speed = speed
+        self.fps = fps
+        self.interpolate = interpolate
+        self.realtime = realtime
+        self.stats = PlaybackStats()
+
+    def _frame(self, t: float, last: int) -> PlaybackFrame:
+        times = self.timeline.times
+        i = self.timeline.frame_at(t)
+        alpha = 0.0
+        if self.interpolate and i + 1 < len(times) and times[i + 1] > times[i]:
+            alpha = min(max((t - times[i]) / (times[i + 1] - times[i]), 0.0), 1.0)
+        if i > last + 1:
+            self.stats.dropped += i - last - 1
+        return PlaybackFrame(i, alpha, t)
+
+    def __iter__(self) -> Iterator[PlaybackFrame]:
+        self.stats = PlaybackStats()
+        start = time.perf_counter()
+        try:
+            if not self.realtime:
+                yield from self._offline()
+            elif self.interpolate:
+                yield from self._realtime_interpolated(start)
+            else:
+                yield from self._realtime(start)
+        finally:
+            self.stats.elapsed = time.perf_counter() - start
+
+    def _offline(self) -> Iterator[PlaybackFrame]:
+        times = self.timeline.times
+        if self.fps is None:
+            for i, t in enumerate(times):
+                self.stats.rendered += 1
+                yield PlaybackFrame(i, 0.0, float(t))
+            return
+
+        last = -1
+        n = int(np.floor(self.timeline.duration * self.fps / self.speed)) + 1
+        for k in range(n):
+            frame = self._frame(k * self.speed / self.fps, last)
+            last = max(last, frame.index)
+            self.stats.rendered += 1
+            yield frame
+
+    def _realtime(self, start: float) -> Iterator[PlaybackFrame]:
+        times = self.timeline.times
+        last = -1
+        while last < len(times) - 1:
+            t = (time.perf_counter() - start) * self.speed
+            frame = self._frame(t, last)
+            if frame.index <= last:
+                # ahead of schedule: sleep until the next frame is due
+                time.sleep(max((times[last + 1] - t) / self.speed, 0.0))
+                continue
+
+            self.stats.max_lag = max(self.stats.max_lag, (t - times[frame.index]) / self.speed)
+            last = frame.index
+            self.stats.rendered += 1
+            yield frame
+
+    def _realtime_interpolated(self, start: float) -> Iterator[PlaybackFrame]:
+        step = 1 / self.fps
+        next_render = start
+        last = -1
+        while True:
+            t = (time.perf_counter() - start) * self.speed
+            done = t >= self.timeline.duration
+            frame = self._frame(min(t, self.timeline.duration), last)
+            last = max(last, frame.index)
+            self.stats.rendered += 1
+            yield frame
+            if done:
+                return
+
+            next_render += step
+            remaining = next_render - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                # late: do not try to catch up with a burst of frames
+                self.stats.max_lag = max(self.stats.max_lag, -remaining)
+                next_render = time.perf_counter()
+
+
+class ChunkedPlayback:
+    """Playback of a recording parsed in chunks (e.g. BeFineSequence.iter_chunks)
+
+    Every chunk is scheduled as soon as it is parsed, so the first frames are
+    shown before the whole file is read. The timing continues across chunks:
+    the gap between the last frame of a chunk and the first of the next one is
+    kept, and offline resampling stays on a single fps grid.
+
+    Yields (chunk, PlaybackFrame), the frame index is relative to the chunk.
+    Same modes of Playback, without interpolation (it would need the frames
+    of the next chunk).
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[Any],
+        timestamps: Callable[[Any], Sequence[int]] = lambda c: c.timestamps,
+        unit: float = 1e-3,
+        speed: float = 1.0,
+        fps: Optional[float] = None,
+        realtime: bool = True,
+    ) -> None:
+        self.chunks = chunks
+        self.timestamps = timestamps
+        self.unit = unit
+        self.speed = speed
+        self.fps = fps
+        self.realtime = realtime
+        self.stats = PlaybackStats()
+        self.origin: Optional[float] = None
+
+    def _times(self, chunk: Any) -> np.ndarray:
+        ts = np.asarray(self.timestamps(chunk), dtype=np.float64)
+        if self.origin is None and len(ts) > 0:
+            self.origin = ts[0] * self.unit
+        # seconds from the first frame of the recording, as Timeline computes them
+        return ts * self.unit - self.origin
+
+    def __iter__(self) -> Iterator[Tuple[Any, PlaybackFrame]]:
+        self.stats = PlaybackStats()
+        self.origin = None
+        start = time.perf_counter()
+        try:
+            if not self.realtime:
+                yield from self._offline()
+            else:
+                yield from self._realtime()
+        finally:
+            self.stats.elapsed = time.perf_counter() - start
+
+    def _offline(self) -> Iterator[Tuple[Any, PlaybackFrame]]:
+        # grid times before the first frame of a chunk belong to the previous one,
+        # so a chunk is only resampled once the next one is parsed
+        prev, prev_times = None, None
+        k = 0
+        last = -1  # frame index of the recording
+
+        def grid(chunk, times, first, end, inclusive):
+            nonlocal k, last
+            while True:
+                # same grid of Playback, k * speed / fps from the first frame
+                t = k * self.speed / self.fps
+                if t > end or (t == end and not inclusive):
+                    return
+                i = min(max(int(np.searchsorted(times, t, side="right")) - 1, 0), len(times) - 1)
+                if first + i > last + 1 and last >= 0:
+                    self.stats.dropped += first + i - last - 1
+                last = max(last, first + i)
+                self.stats.rendered += 1
+                k += 1
+                yield chunk, PlaybackFrame(i, 0.0, t)
+
+        offset = 0
+        prev_offset = 0
+        for chunk in self.chunks:
+            times = self._times(chunk)
+            if len(times) == 0:
+                continue
+            if self.fps is None:
+                for i, t in enumerate(times):
+                    self.stats.rendered += 1
+                    yield chunk, PlaybackFrame(i, 0.0, float(t))
+                continue
+
+            if prev is not None:
+                yield from grid(prev, prev_times, prev_offset, times[0], inclusive=False)
+            prev, prev_times, prev_offset = chunk, times, offset
+            offset += len(times)
+
+        if prev is not None:
+            yield from grid(prev, prev_times, prev_offset, prev_times[-1], inclusive=True)
+
+    def _realtime(self) -> Iterator[Tuple[Any, PlaybackFrame]]:
+        prev, prev_time = None, 0.0
+        for chunk in self.chunks:
+            times = self._times(chunk)
+            if len(times) == 0:
+                continue
+            if prev is not None:
+                # frame 0 of the timeline is the last frame of the previous chunk:
+                # the gap to the first frame of this chunk is waited
+                times = np.concatenate([[prev_time], times])
+
+            playback = Playback(Timeline(times), self.speed, realtime=True)
+            shift = 1 if prev is not None else 0
+            for frame in playback:
+                if frame.index < shift:
+                    # already shown at the end of the previous chunk
+                    playback.stats.rendered -= 1
+                    continue
+                yield chunk, frame._replace(index=frame.index - shift)
+
+            self.stats.rendered += playback.stats.rendered
+            self.stats.dropped += playback.stats.dropped
+            self.stats.max_lag = max(self.stats.max_lag, playback.stats.max_lag)
+            prev, prev_time = chunk, times[-1]
+
+
+def interpolate(frames: np.ndarray, frame: PlaybackFrame) -> np.ndarray:
+    """Frame of a [T,...] array at a PlaybackFrame, linearly interpolated"""
+    i = frame.index
+    if frame.alpha == 0.0 or i + 1 >= len(frames):
+        return frames[i]
+    return (1.0 - frame.alpha) * frames[i] + frame.alpha * frames[i + 1]
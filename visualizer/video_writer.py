@@ -0,0 +1,188 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from typing import Optional
+import numpy as np
+
+
+class VideoWriter:
+    """Encode rendered frames straight into a video file
+
+    Frames (uint8 RGB [H,W,3], e.g. Open3DWrapper.capture()) are put in a
+    bounded queue and encoded by a background thread, either piping raw
+    frames into a single ffmpeg process (backend="ffmpeg") or with PyAV in
+    process (backend="av"). write() blocks when the encoder falls behind by
+    more than queue_size frames. Both backends pad odd sizes with a black
+    row/column, yuv420p requires even sizes.
+
+    With jpeg_dir set, every frame is also saved as <jpeg_dir>/<i>.jpg for
+    debugging (the old run/befine_show_poses.py + make_videos.py output),
+    encoded with PyAV.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fps: float = 25,
+        queue_size: int = 32,
+        jpeg_dir: Optional[str] = None,
+        backend: str = "ffmpeg",
+        codec: str = "libx264",
+        crf: int = 20,
+    ) -> None:
+        assert backend in ("ffmpeg", "av"), f"Unknown backend {backend}"
+        if backend == "ffmpeg" and shutil.which("ffmpeg") is None:
+            raise RuntimeError("ffmpeg not found in PATH, install it or use backend='av'")
+
+        self.path = path
+        self.fps = fps
+        self.jpeg_dir = jpeg_dir
+        self.backend = backend
+        self.codec = codec
+        self.crf = crf
+
+        # export workers may create the same folder concurrently
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        if jpeg_dir is not None:
+            os.makedirs(jpeg_dir, exist_ok=True)
+
+        self.frames = 0
+        self.jpeg_encoder = None
+        self.error: Optional[BaseException] = None
+        self.queue: "queue.Queue[Optional[np.ndarray]]" = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self) -> "VideoWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, frame: np.ndarray) -> None:
+        if self.error is not None:
+            raise RuntimeError(f"Video encoding of {self.path} failed") from self.error
+        assert frame.ndim == 3 and frame.shape[2] == 3, "Expected an RGB frame [H,W,3]"
+
+        self.queue.put(np.ascontiguousarray(frame, dtype=np.uint8))
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Video encoding of {self.path} failed") from self.error
+
+    def _run(self) -> None:
+        encoder = None
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                if encoder is None:
+                    h, w = frame.shape[:2]
+                    encoder = self._open_ffmpeg(w, h) if self.backend == "ffmpeg" else self._open_av(w, h)
+                encoder.write(frame)
+                if self.jpeg_dir is not None:
+                    self._save_jpeg(frame)
+                self.frames += 1
+        except BaseException as e:
+            self.error = e
+            # unblock a producer waiting on a full queue
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+        finally:
+            if encoder is not None:
+                try:
+                    encoder.close()
+                except BaseException as e:
+                    self.error = self.error or e
+
+    def _save_jpeg(self, frame: np.ndarray) -> None:
+        import av
+
+        if self.jpeg_encoder is None:
+            from fractions import Fraction
+
+            self.jpeg_encoder = av.CodecContext.create("mjpeg", "w")
+            self.jpeg_encoder.width = frame.shape[1]
+            self.jpeg_encoder.height = frame.shape[0]
+            self.jpeg_encoder.pix_fmt = "yuvj420p"
+            self.jpeg_encoder.time_base = Fraction(1, 25)
+            self.jpeg_encoder.open()
+
+        image = av.VideoFrame.from_ndarray(frame, format="rgb24").reformat(format="yuvj420p")
+        # every mjpeg packet is a complete JPEG file
+        with open(os.path.join(self.jpeg_dir, f"{self.frames}.jpg"), "wb") as fp:
+            for packet in self.jpeg_encoder.encode(image):
+                fp.write(bytes(packet))
+
+    def _open_ffmpeg(self, width: int, height: int) -> "_FFmpegEncoder":
+        return _FFmpegEncoder(self.path, width, height, self.fps, self.codec, self.crf)
+
+    def _open_av(self, width: int, height: int) -> "_AVEncoder":
+        return _AVEncoder(self.path, width, height, self.fps, self.codec, self.crf)
+
+
+class _FFmpegEncoder:
+    def __init__(
+        self, path: str, width: int, height: int, fps: float, codec: str, crf: int
+    ) -> None:
+        # fmt: off
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            # yuv420p requires even sizes
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", codec, "-pix_fmt", "yuv420p", "-crf", str(crf),
+            path,
+        ]
+        # fmt: on
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray) -> None:
+        self.process.stdin.write(frame.data)
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+
+
+class _AVEncoder:
+    def __init__(
+        self, path: str, width: int, height: int, fps: float, codec: str, crf: int
+    ) -> None:
+        import av
+        from fractions import Fraction
+
+        self.av = av
+        self.container = av.open(path, "w")
+        self.stream = self.container.add_stream(codec, rate=Fraction(fps).limit_denominator(1000))
+        # yuv420p requires even sizes, padded as the ffmpeg backend does
+        self.pad = ((0, height % 2), (0, width % 2), (0, 0))
+        self.stream.width = width + width % 2
+        self.stream.height = height + height % 2
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.options = {"crf": str(crf)}
+
+    def write(self, frame: np.ndarray) -> None:
+        if self.pad[0][1] or self.pad[1][1]:
+            frame = np.pad(frame, self.pad)
+        video_frame = self.av.VideoFrame.from_ndarray(frame, format="rgb24")
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    def close(self) -> None:
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()